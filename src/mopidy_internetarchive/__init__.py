@@ -91,14 +91,33 @@ class Extension(ext.Extension):
             collections=config.List(),
             audio_formats=config.List(),
             image_formats=config.List(),
+            image_service=config.Boolean(),
             browse_limit=config.Integer(minimum=1, optional=True),
+            browse_paginate=config.Boolean(),
+            browse_warmup=config.Boolean(),
             browse_views=ConfigMap(keys=config.String(choices=SORT_FIELDS)),
             search_limit=config.Integer(minimum=1, optional=True),
             search_order=config.String(choices=SORT_FIELDS, optional=True),
             cache_size=config.Integer(minimum=1, optional=True),
             cache_ttl=config.Integer(minimum=0, optional=True),
+            cache_stale_ttl=config.Integer(minimum=0, optional=True),
+            cache_max_bytes=config.Integer(minimum=1, optional=True),
+            cache_snapshot=config.Boolean(),
+            disk_cache_size=config.Integer(minimum=1, optional=True),
+            track_cache_size=config.Integer(minimum=1, optional=True),
+            resolve_ttl=config.Integer(minimum=1, optional=True),
+            audio_cache_size=config.Integer(minimum=1, optional=True),
+            playback_prefetch=config.Boolean(),
+            prefetch_count=config.Integer(minimum=1, optional=True),
+            prefetch_delay=config.Integer(minimum=0),
             retries=config.Integer(minimum=0),
+            retry_backoff=config.Integer(minimum=0),
+            retry_jitter=config.Integer(minimum=0),
             timeout=config.Integer(minimum=0, optional=True),
+            concurrency=config.Integer(minimum=1),
+            pool_connections=config.Integer(minimum=1),
+            pool_maxsize=config.Integer(minimum=1),
+            keep_alive=config.Boolean(),
             # no longer used
             browse_order=config.Deprecated(),
             exclude_collections=config.Deprecated(),
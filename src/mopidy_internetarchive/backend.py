@@ -1,22 +1,31 @@
+import logging
+import operator
+
 import cachetools
 
 from mopidy import backend, httpclient
 
 import pykka
 
-from . import Extension
+from . import Extension, cache, prefetch, translator
 from .client import InternetArchiveClient
 from .library import InternetArchiveLibraryProvider
 from .playback import InternetArchivePlaybackProvider
 
+RESOLVE_CACHE_SIZE = 1024
+
+logger = logging.getLogger(__name__)
 
-def _cache(cache_size=None, cache_ttl=None, **kwargs):
-    if cache_size is None:
+
+def _store(config, cache_ttl=None, disk_cache_size=None, **kwargs):
+    if disk_cache_size is None:
+        return None
+    path = Extension.get_cache_dir(config) / "metadata.db"
+    try:
+        return cache.MetadataStore(path, disk_cache_size, cache_ttl)
+    except Exception as e:
+        logger.warning("Error opening disk cache %s: %s", path, e)
         return None
-    elif cache_ttl is None:
-        return cachetools.LRUCache(cache_size)
-    else:
-        return cachetools.TTLCache(cache_size, cache_ttl)
 
 
 class InternetArchiveBackend(pykka.ThreadingActor, backend.Backend):
@@ -31,12 +40,94 @@ class InternetArchiveBackend(pykka.ThreadingActor, backend.Backend):
             ext_config["base_url"],
             retries=ext_config["retries"],
             timeout=ext_config["timeout"],
+            max_workers=ext_config["concurrency"],
+            backoff=ext_config["retry_backoff"] / 1000,
+            jitter=ext_config["retry_jitter"] / 1000,
+            pool_connections=ext_config["pool_connections"],
+            pool_maxsize=ext_config["pool_maxsize"],
+            keep_alive=ext_config["keep_alive"],
         )
         product = f"{Extension.dist_name}/{Extension.version}"
         client.useragent = httpclient.format_user_agent(product)
         proxy = httpclient.format_proxy(config["proxy"])
         client.proxies.update({"http": proxy, "https": proxy})
-        client.cache = _cache(**ext_config)
+        client.formats = ext_config["audio_formats"] + ext_config["image_formats"]
+        client.fields = translator.ITEM_FIELDS
+        client.stale_ttl = ext_config["cache_stale_ttl"]
+        if ext_config["resolve_ttl"] is not None:
+            client.urls = cache.create(RESOLVE_CACHE_SIZE, ext_config["resolve_ttl"])
+        else:
+            logger.debug("Resolving Internet Archive download URLs is disabled")
+        # expired items are kept for revalidation, so no TTL cache here
+        client.cache = cache.create(
+            ext_config["cache_size"],
+            cache_max_bytes=ext_config["cache_max_bytes"],
+            getsizeof=operator.attrgetter("size"),  # computed once per fetch
+        )
+        client.ttl = ext_config["cache_ttl"]
+        client.store = _store(config, **ext_config)
+        if ext_config["audio_cache_size"]:
+            client.files = cache.FileCache(
+                Extension.get_cache_dir(config) / "audio",
+                ext_config["audio_cache_size"] * 1024 * 1024,
+                client.download,
+            )
+        if ext_config["prefetch_count"]:
+            client.prefetcher = prefetch.Prefetcher(
+                client.warm,
+                ext_config["prefetch_count"],
+                ext_config["prefetch_delay"] / 1000,
+                name="InternetArchivePrefetcher",
+            )
 
         self.library = InternetArchiveLibraryProvider(ext_config, self)
-        self.playback = InternetArchivePlaybackProvider(audio, self)
+        self.__warmup = ext_config["browse_warmup"]
+        if ext_config["cache_snapshot"]:
+            path = Extension.get_cache_dir(config) / "snapshot.json.gz"
+            client.snapshot = cache.Snapshot(path)
+        self.playback = InternetArchivePlaybackProvider(ext_config, audio, self)
+
+    def on_start(self):
+        if self.client.snapshot is not None:
+            # items and tracks are restored when first needed
+            self.client.submit(self.client.snapshot.load)
+            self.library.restore(self.client.snapshot)
+        if self.__warmup:
+            self.library.warmup()
+
+    def on_stop(self):
+        logger.debug("Internet Archive client stats: %s", dict(self.client.stats))
+        if self.client.cache is not None:
+            logger.debug(
+                "Internet Archive cache size: %d of %d",
+                self.client.cache.currsize,
+                self.client.cache.maxsize,
+            )
+        if self.client.snapshot is not None:
+            self.__save(self.client.snapshot)
+        # stop client workers before closing the store they use
+        self.library.close()
+        self.client.close()
+        if self.client.store is not None:
+            self.client.store.close()
+
+    def __save(self, snapshot):
+        client = self.client
+        if client.cache is not None:
+            # keep unrestored items unless evicted by more recent ones
+            items = cachetools.LRUCache(
+                client.cache.maxsize, getsizeof=client.cache.getsizeof
+            )
+            with client.lock:
+                entries = snapshot.entries() + list(client.cache.items())
+            for key, entry in entries:
+                try:
+                    items[key] = entry
+                except ValueError:
+                    pass  # value too large
+        else:
+            items = {}
+        try:
+            snapshot.save(items.items(), **self.library.snapshot())
+        except Exception as e:
+            logger.warning("Error saving snapshot: %s", e)
@@ -0,0 +1,372 @@
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import MutableMapping
+
+import cachetools
+
+from mopidy.models import ModelJSONEncoder, model_json_decoder
+
+SCHEMA_VERSION = 2
+
+SNAPSHOT_VERSION = 3
+
+Entry = collections.namedtuple("Entry", "value timestamp etag modified size")
+
+logger = logging.getLogger(__name__)
+
+
+def create(
+    cache_size=None, cache_ttl=None, cache_max_bytes=None, getsizeof=None, **kwargs
+):
+    if cache_max_bytes is not None:
+        maxsize, getsizeof = cache_max_bytes, getsizeof or sizeof
+    elif cache_size is not None:
+        maxsize, getsizeof = cache_size, None
+    else:
+        return None
+    if cache_ttl is None:
+        return cachetools.LRUCache(maxsize, getsizeof=getsizeof)
+    else:
+        return cachetools.TTLCache(maxsize, cache_ttl, getsizeof=getsizeof)
+
+
+def sizeof(value):
+    """Return the estimated size of a cached value in bytes."""
+    try:
+        return len(json.dumps(value, cls=ModelJSONEncoder, separators=(",", ":")))
+    except TypeError:
+        return 1  # pending futures, etc.
+
+
+def dump(path, obj):
+    """Write a compressed JSON snapshot, which may contain Mopidy models."""
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(obj, f, cls=ModelJSONEncoder, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load(path):
+    """Read a compressed JSON snapshot written by `dump()`."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f, object_hook=model_json_decoder)
+
+
+class Snapshot:
+    """Snapshot of cached items, root directories and tracks.
+
+    The snapshot file is only read on first use, so this may happen in
+    the background.  Items are removed from the snapshot when they are
+    restored, so each item is restored at most once.
+
+    """
+
+    def __init__(self, path):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__data = None
+
+    def load(self):
+        """Return the snapshot's contents, reading the file if needed."""
+        with self.__lock:
+            if self.__data is None:
+                self.__data = self.__read()
+            return self.__data
+
+    def pop(self, key):
+        """Remove and return the entry for item `key`, or `None`."""
+        items = self.load()["items"]
+        with self.__lock:
+            return items.pop(key, None)
+
+    def entries(self):
+        """Return all `(key, entry)` pairs not restored yet."""
+        items = self.load()["items"]
+        with self.__lock:
+            return list(items.items())
+
+    def save(self, entries, **kwargs):
+        """Write item `(key, entry)` pairs and other data to the file."""
+        items = [(key, *entry) for key, entry in entries]
+        obj = dict(kwargs, version=SNAPSHOT_VERSION, timestamp=time.time())
+        dump(self.__path, dict(obj, items=items))
+
+    def __read(self):
+        try:
+            obj = load(self.__path)
+        except FileNotFoundError:
+            obj = {}
+        except Exception as e:
+            logger.warning("Error loading snapshot %s: %s", self.__path, e)
+            obj = {}
+        if obj.get("version") != SNAPSHOT_VERSION:
+            obj = {"timestamp": 0}
+        obj["items"] = collections.OrderedDict(
+            (key, Entry(*values)) for key, *values in obj.get("items", [])
+        )
+        return obj
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def _loads(data):
+    return json.loads(data.decode())
+
+
+class MetadataStore(MutableMapping):
+    """Persistent Internet Archive metadata store.
+
+    Items are kept as compressed JSON in an SQLite database, together
+    with their fetch time and HTTP cache validators.  Items older than
+    `ttl` seconds are treated as missing, but are retained for
+    revalidation until the least recently used items are evicted when
+    the store grows beyond `maxsize` items.
+
+    """
+
+    def __init__(self, path, maxsize, ttl=None, timer=time.time):
+        self.__path = path
+        self.__conn = sqlite3.connect(
+            str(path), isolation_level=None, check_same_thread=False
+        )
+        self.__lock = threading.RLock()
+        self.__maxsize = maxsize
+        self.__ttl = ttl
+        self.__timer = timer
+        with self.__lock:
+            self.__setup()
+
+    def __getitem__(self, key):
+        entry = self.entry(key)
+        if entry is None or self.expired(entry):
+            raise KeyError(key)
+        return entry.value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __delitem__(self, key):
+        with self.__lock:
+            if not self.__execute("DELETE FROM items WHERE key = ?", key).rowcount:
+                raise KeyError(key)
+
+    def __iter__(self):
+        with self.__lock:
+            keys = self.__execute("SELECT key FROM items").fetchall()
+        return (key for key, in keys)
+
+    def __len__(self):
+        with self.__lock:
+            return self.__execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def entry(self, key):
+        """Return the entry for `key`, including stale entries."""
+        with self.__lock:
+            row = self.__execute(
+                "SELECT value, timestamp, etag, modified, size "
+                "FROM items WHERE key = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            self.__execute(
+                "UPDATE items SET atime = ? WHERE key = ?", self.__timer(), key
+            )
+        return Entry(_loads(zlib.decompress(row[0])), *row[1:])
+
+    def expired(self, entry, grace=0):
+        if self.__ttl is None:
+            return False
+        else:
+            return entry.timestamp + self.__ttl + grace < self.__timer()
+
+    def put(self, key, value, etag=None, modified=None):
+        data = _dumps(value)
+        now = self.__timer()
+        with self.__lock:
+            self.__execute(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?)",
+                key,
+                zlib.compress(data),
+                now,
+                now,
+                etag,
+                modified,
+                len(data),
+            )
+            self.__execute(
+                "DELETE FROM items WHERE key IN ("
+                "SELECT key FROM items ORDER BY atime DESC LIMIT -1 OFFSET ?"
+                ")",
+                self.__maxsize,
+            )
+
+    def touch(self, key):
+        """Mark the entry for `key` as freshly validated."""
+        now = self.__timer()
+        with self.__lock:
+            self.__execute(
+                "UPDATE items SET timestamp = ?, atime = ? WHERE key = ?",
+                now,
+                now,
+                key,
+            )
+
+    def clear(self):
+        with self.__lock:
+            self.__execute("DELETE FROM items")
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
+
+    def __execute(self, sql, *args):
+        return self.__conn.execute(sql, args)
+
+    def __setup(self):
+        if self.__execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.__execute("DROP TABLE IF EXISTS items")
+        self.__execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "key TEXT PRIMARY KEY, "
+            "value BLOB NOT NULL, "
+            "timestamp REAL NOT NULL, "
+            "atime REAL NOT NULL, "
+            "etag TEXT, "
+            "modified TEXT, "
+            "size INTEGER NOT NULL"
+            ")"
+        )
+        self.__execute("CREATE INDEX IF NOT EXISTS items_atime ON items (atime)")
+        self.__execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+
+class FileCache:
+    """On-disk cache of downloaded files.
+
+    Files are downloaded in the background by calling `download` with
+    a URL and a binary file object, and are only added to the cache if
+    they match their expected size and MD5 checksum.  The least
+    recently used files are removed when the total size of all cached
+    files exceeds `maxsize` bytes.
+
+    """
+
+    def __init__(self, path, maxsize, download):
+        self.__path = pathlib.Path(path)
+        self.__path.mkdir(parents=True, exist_ok=True)
+        self.__maxsize = maxsize
+        self.__download = download
+        self.__lock = threading.Lock()
+        self.__pending = set()
+        self.__futures = set()
+        self.__closed = threading.Event()
+        self.__executor = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix=self.__class__.__name__
+        )
+
+    def get(self, key):
+        """Return the path of a cached file, or `None` if not cached."""
+        path = self.__filepath(key)
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        else:
+            return path
+
+    def fetch(self, key, url, size=None, md5=None):
+        """Download a file in the background unless cached or pending."""
+        if size is not None and int(size) > self.__maxsize:
+            return None
+        with self.__lock:
+            if key in self.__pending or self.__filepath(key).exists():
+                return None
+            self.__pending.add(key)
+            future = self.__executor.submit(self.__fetch, key, url, size, md5)
+            self.__futures.add(future)
+        future.add_done_callback(self.__done)
+        return future
+
+    def close(self):
+        """Abort any running download and cancel pending downloads."""
+        self.__closed.set()
+        with self.__lock:
+            futures = list(self.__futures)
+        for future in futures:
+            future.cancel()
+        self.__executor.shutdown(wait=False)
+
+    def __done(self, future):
+        with self.__lock:
+            self.__futures.discard(future)
+
+    def __fetch(self, key, url, size, md5):
+        path = self.__filepath(key)
+        tmp = path.with_name(path.name + ".part")
+        try:
+            digest = hashlib.md5()
+            with open(tmp, "wb") as f:
+                self.__download(url, _HashWriter(f, digest, self.__closed))
+            if size is not None and tmp.stat().st_size != int(size):
+                raise ValueError("Size mismatch for %s" % url)
+            if md5 is not None and digest.hexdigest() != md5:
+                raise ValueError("MD5 mismatch for %s" % url)
+            os.replace(tmp, path)
+        except Exception as e:
+            if self.__closed.is_set():
+                logger.debug("Aborted caching %s: %s", url, e)
+            else:
+                logger.warning("Error caching %s: %s", url, e)
+            if tmp.exists():
+                tmp.unlink()
+        else:
+            logger.debug("Cached %s as %s", url, path)
+            self.__evict()
+        finally:
+            with self.__lock:
+                self.__pending.discard(key)
+
+    def __evict(self):
+        entries = []
+        for path in self.__path.iterdir():
+            if path.suffix != ".part":
+                stat = path.stat()
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.__maxsize:
+                break
+            logger.debug("Removing %s from cache", path)
+            path.unlink()
+            total -= size
+
+    def __filepath(self, key):
+        name = hashlib.sha1(key.encode()).hexdigest()
+        return self.__path / (name + os.path.splitext(key)[1])
+
+
+class _HashWriter:
+    def __init__(self, f, digest, closed):
+        self.__file = f
+        self.__digest = digest
+        self.__closed = closed
+
+    def write(self, data):
+        # raising here also closes the download's response
+        if self.__closed.is_set():
+            raise OSError("Download aborted")
+        self.__digest.update(data)
+        return self.__file.write(data)
@@ -1,31 +1,215 @@
-import operator
+import collections
+import concurrent.futures
+import logging
+import sqlite3
+import threading
+import time
 import urllib.parse
 from collections.abc import Sequence
 
-import cachetools
-
 import requests
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+from .cache import Entry, sizeof
+
 BASE_URL = "https://archive.org/"
 
+# domain of servers that download URLs redirect to
+ARCHIVE_DOMAIN = "archive.org"
+
+# HTTP status codes to retry, and maximum Retry-After delay in seconds
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RETRY_AFTER_MAX = 60
+
+# minimum and maximum number of results per scrape API request
+SCRAPE_COUNT = (100, 10000)
+
+logger = logging.getLogger(__name__)
+
+
+class _Retry(requests.adapters.Retry):
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, RETRY_AFTER_MAX)
+        else:
+            return None
+
+
+def _retry(retries, backoff, jitter):
+    kwargs = {
+        "total": retries,
+        "backoff_factor": backoff,
+        "status_forcelist": RETRY_STATUS,
+        "raise_on_status": False,
+    }
+    try:
+        return _Retry(backoff_jitter=jitter, **kwargs)
+    except TypeError:  # urllib3 < 2.0
+        return _Retry(**kwargs)
+
+
+class _SingleFlight:
+    # share the result of concurrent calls with the same key
+    def __init__(self, lock, stats):
+        self.__lock = lock
+        self.__calls = {}
+        self.__stats = stats
+
+    def __call__(self, key, func, *args):
+        with self.__lock:
+            future = self.__calls.get(key)
+            if future is not None:
+                self.__stats["coalesced"] += 1
+            else:
+                self.__calls[key] = concurrent.futures.Future()
+        if future is not None:
+            return future.result()
+        future = self.__calls[key]
+        try:
+            result = func(*args)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+
+
+def _keep(obj, formats):
+    # original files may provide metadata for derived files
+    return obj.get("format") in formats or obj.get("source") == "original"
+
+
+def _filter(obj, formats):
+    if "files" in obj:
+        obj["files"] = [f for f in obj["files"] if _keep(f, formats)]
+    return obj
+
+
+def _project(item, fields):
+    # only keep the given metadata and file keys
+    obj = {}
+    for key, keys in fields.items():
+        if isinstance(item.get(key), list):
+            obj[key] = [{k: v[k] for k in keys if k in v} for v in item[key]]
+        elif key in item:
+            obj[key] = {k: item[key][k] for k in keys if k in item[key]}
+    return obj
+
 
-def _session(base_url, retries):
-    # TODO: backoff?
-    session = requests.Session()
-    adapter = requests.adapters.HTTPAdapter(max_retries=retries)
-    session.mount(base_url, adapter)
-    return session
+def _parse(stream, formats):
+    # decode item metadata incrementally, only keeping wanted files
+    obj = {}
+    builder = path = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == path and event in ("end_map", "end_array"):
+                if path != "files.item":
+                    obj[path] = builder.value
+                elif _keep(builder.value, formats):
+                    obj["files"].append(builder.value)
+                builder = None
+        elif prefix == "files":
+            if event == "start_array":
+                obj["files"] = []
+        elif prefix == "files.item" or (prefix and "." not in prefix):
+            # keep other top-level values, as returned by response.json()
+            if event in ("start_map", "start_array"):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                path = prefix
+            elif prefix != "files.item":
+                obj[prefix] = value
+    return obj
+
+
+def _key(*args):
+    return tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args)
+
+
+def _session(
+    base_url, retries, backoff=0, jitter=0, pool_connections=10, pool_maxsize=10
+):
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=_retry(retries, backoff, jitter),
+    )
+    # also used for archive.org servers that downloads are redirected to
+    hosts = {urllib.parse.urlsplit(base_url).hostname, ARCHIVE_DOMAIN}
+    return _Session(adapter, hosts)
+
+
+class _Session(requests.Session):
+    def __init__(self, adapter, hosts):
+        super().__init__()
+        self.__adapter = adapter
+        self.__hosts = hosts
+
+    def get_adapter(self, url):
+        host = urllib.parse.urlsplit(url).hostname or ""
+        for domain in self.__hosts:
+            if host == domain or host.endswith("." + domain):
+                return self.__adapter
+        return super().get_adapter(url)
+
+    def close(self):
+        super().close()
+        self.__adapter.close()
 
 
 class InternetArchiveClient:
 
     pykka_traversable = True
 
-    def __init__(self, base_url=BASE_URL, retries=0, timeout=None):
+    def __init__(
+        self,
+        base_url=BASE_URL,
+        retries=0,
+        timeout=None,
+        max_workers=1,
+        backoff=0,
+        jitter=0,
+        pool_connections=10,
+        pool_maxsize=10,
+        keep_alive=True,
+    ):
         self.__base_url = base_url
-        self.__session = _session(base_url, retries)
+        self.__session = _session(
+            base_url, retries, backoff, jitter, pool_connections, pool_maxsize
+        )
+        if not keep_alive:
+            self.__session.headers["Connection"] = "close"
+        self.__pool_maxsize = pool_maxsize
+        self.__active = 0
         self.__timeout = timeout
+        self.__executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix=self.__class__.__name__
+        )
+        self.lock = threading.RLock()  # public
         self.cache = None  # public
+        self.ttl = None  # public
+        self.timer = time.time  # public
+        self.store = None  # public
+        self.snapshot = None  # public
+        self.prefetcher = None  # public
+        self.formats = None  # public
+        self.fields = None  # public
+        self.stale_ttl = None  # public
+        self.urls = None  # public
+        self.files = None  # public
+        self.stats = collections.Counter()
+        self.__flight = _SingleFlight(self.lock, self.stats)
+        self.__revalidating = set()  # identifiers queued for revalidation
 
     @property
     def proxies(self):
@@ -39,17 +223,57 @@ class InternetArchiveClient:
     def useragent(self, value):
         self.__session.headers["User-Agent"] = value
 
-    @cachetools.cachedmethod(operator.attrgetter("cache"))
     def getitem(self, identifier):
-        obj = self.__get("/metadata/%s" % identifier).json()
-        if not obj:
-            raise LookupError(identifier)
-        elif "error" in obj:
-            raise LookupError(obj["error"])
-        elif "result" in obj:
-            return obj["result"]
-        else:
-            return obj
+        entry = self.__entry(identifier)
+        if entry is not None and not self.__expired(entry):
+            self.__count(hits=1)
+            return entry.value
+        return self.__flight(_key("getitem", identifier), self.__fetchitem, identifier)
+
+    def getitems(self, identifiers):
+        """Retrieve multiple items, fetching uncached items concurrently.
+
+        Returns a dict mapping each identifier to its item, or to the
+        exception raised when retrieving it.
+        """
+        results = {}
+        futures = {}
+        for identifier in identifiers:
+            if identifier in results or identifier in futures:
+                pass
+            elif self.__cached(identifier):
+                results[identifier] = self.getitem(identifier)
+            else:
+                futures[identifier] = self.__executor.submit(self.getitem, identifier)
+        for identifier, future in futures.items():
+            try:
+                results[identifier] = future.result()
+            except Exception as e:
+                results[identifier] = e
+        return results
+
+    def download(self, url, f, chunk_size=65536):
+        """Download a file, writing its contents to a binary file object."""
+        with self.__session.get(url, stream=True, timeout=self.__timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+                self.__count(downloaded_bytes=len(chunk))
+
+    def evict(self, identifier):
+        """Remove an item from all caches."""
+        with self.lock:
+            if self.cache is not None:
+                self.cache.pop(identifier, None)
+        try:
+            self.__store("__delitem__", identifier)
+        except KeyError:
+            pass
+        prefix = self.geturl(identifier) + "/"
+        with self.lock:
+            if self.urls is not None:
+                for url in [url for url in self.urls if url.startswith(prefix)]:
+                    self.urls.pop(url, None)
 
     def geturl(self, identifier, filename=None):
         if filename:
@@ -58,7 +282,223 @@ class InternetArchiveClient:
             path = "/download/%s" % identifier
         return urllib.parse.urljoin(self.__base_url, path)
 
+    def getimageurl(self, identifier):
+        return urllib.parse.urljoin(self.__base_url, "/services/img/%s" % identifier)
+
+    def peek(self, identifier):
+        """Return an item if cached in memory, without retrieving it."""
+        entry = self.__entry(identifier)
+        return entry.value if entry is not None else None
+
+    def timestamp(self, identifier):
+        """Return the time a cached item was retrieved, or `None`."""
+        entry = self.__entry(identifier)
+        return entry.timestamp if entry is not None else None
+
+    def prefetch(self, identifiers):
+        """Retrieve uncached items in the background.
+
+        This cancels any pending requests from previous calls.
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.prefetch(identifiers)
+
+    def resolve(self, url, block=True):
+        """Return the location a download URL redirects to.
+
+        Resolved locations are cached in `urls`; if this is not set, or
+        the URL cannot be resolved, the URL is returned unchanged.  If
+        `block` is false, uncached URLs are returned unchanged and
+        resolved in the background.
+        """
+        if self.urls is None:
+            return url
+        with self.lock:
+            location = self.urls.get(url)
+        if location is not None:
+            return location
+        if not block:
+            self.__executor.submit(self.resolve, url)
+            return url
+        try:
+            response = self.__session.head(
+                url, allow_redirects=False, timeout=self.__timeout
+            )
+        except Exception as e:
+            logger.warning("Error resolving %s: %s", url, e)
+            return url
+        self.__count(resolved=1)
+        if response.is_redirect:
+            location = urllib.parse.urljoin(url, response.headers["Location"])
+        elif response.ok:
+            location = url
+        else:
+            logger.warning("Error resolving %s: HTTP %d", url, response.status_code)
+            return url
+        with self.lock:
+            try:
+                self.urls[url] = location
+            except ValueError:
+                pass  # value too large
+        return location
+
+    def scrape(self, query, fields=None, sort=None, count=None):
+        """Iterate over all search results using the scrape API.
+
+        Results are retrieved lazily in pages of `count` documents, so
+        only a single page is kept in memory at a time.
+        """
+        cursor = None
+        while True:
+            items, cursor = self.scrapepage(query, fields, sort, count, cursor)
+            yield from items
+            if cursor is None:
+                break
+
+    def scrapepage(self, query, fields=None, sort=None, count=None, cursor=None):
+        """Retrieve a single page of search results using the scrape API.
+
+        Returns the page's documents and the cursor of the next page, or
+        `None` if this is the last page.
+        """
+        lo, hi = SCRAPE_COUNT
+        params = {
+            "q": query,
+            "fields": ",".join(fields) if fields else None,
+            "sorts": ",".join(sort) if sort else None,
+            "count": max(lo, min(count or hi, hi)),
+            "cursor": cursor,
+        }
+        response = self.__get("/services/search/v1/scrape", params=params)
+        obj = response.json() if response.content else None
+        if not obj:
+            raise self.SearchError(response.url)
+        elif "error" in obj:
+            raise self.SearchError(obj["error"])
+        return obj.get("items", []), obj.get("cursor") or None
+
     def search(self, query, fields=None, sort=None, rows=None, start=None):
+        key = _key("search", query, fields, sort, rows, start)
+        return self.__flight(key, self.__search, query, fields, sort, rows, start)
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule a callable to be executed by the client's workers."""
+        return self.__executor.submit(func, *args, **kwargs)
+
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+        if self.files is not None:
+            self.files.close()
+        self.__executor.shutdown(wait=False)
+
+    def warm(self, identifier):
+        """Retrieve an item unless it is cached; returns true if fetched."""
+        if self.__cached(identifier):
+            return False
+        self.getitem(identifier)
+        return True
+
+    def __cached(self, identifier):
+        entry = self.__entry(identifier)
+        return entry is not None and not self.__expired(entry)
+
+    def __count(self, **counts):
+        with self.lock:
+            self.stats.update(counts)
+
+    def __entry(self, identifier):
+        with self.lock:
+            return self.cache.get(identifier) if self.cache is not None else None
+
+    def __expired(self, entry, grace=0):
+        if self.ttl is None:
+            return False
+        else:
+            return entry.timestamp + self.ttl + grace < self.timer()
+
+    def __put(self, identifier, entry):
+        with self.lock:
+            if self.cache is not None:
+                try:
+                    self.cache[identifier] = entry
+                except ValueError:
+                    pass  # value too large
+
+    def __store(self, name, *args, **kwargs):
+        # the disk cache is optional, so errors only disable it for this call
+        if self.store is None:
+            return None
+        try:
+            return getattr(self.store, name)(*args, **kwargs)
+        except sqlite3.Error as e:
+            logger.warning("Error accessing Internet Archive disk cache: %s", e)
+            return None
+
+    def __fetchitem(self, identifier):
+        # expired entries are kept with their validators for revalidation
+        entry = self.__entry(identifier)
+        if entry is None:
+            entry = self.__store("entry", identifier)
+            if entry is not None and not self.__expired(entry):
+                self.__count(store_hits=1)
+                self.__put(identifier, entry)
+        if entry is None and self.snapshot is not None:
+            # snapshot items keep their timestamps for revalidation
+            entry = self.snapshot.pop(identifier)
+            if entry is not None:
+                self.__count(restored=1)
+                self.__put(identifier, entry)
+        if entry is not None and not self.__expired(entry):
+            return entry.value
+        if entry is not None and self.stale_ttl is not None:
+            if not self.__expired(entry, self.stale_ttl):
+                # serve stale item while revalidating in the background
+                with self.lock:
+                    self.stats["stale"] += 1
+                    pending = identifier in self.__revalidating
+                    self.__revalidating.add(identifier)
+                if not pending:
+                    self.__executor.submit(self.__revalidate, identifier, entry)
+                return entry.value
+        return self.__fetch(identifier, entry)
+
+    def __fetch(self, identifier, entry=None):
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.modified:
+            headers["If-Modified-Since"] = entry.modified
+        path = "/metadata/%s" % identifier
+        with self.__get(path, headers=headers, stream=True) as response:
+            if entry is not None and response.status_code == 304:
+                logger.debug("Revalidated Internet Archive item %s", identifier)
+                self.__store("touch", identifier)
+                self.__count(revalidated=1, revalidated_bytes=entry.size)
+                self.__put(identifier, entry._replace(timestamp=self.timer()))
+                return entry.value
+            item = self.__item(identifier, self.__decode(response))
+            if self.fields is not None:
+                item = _project(item, self.fields)
+            self.__count(misses=1, fetched_bytes=response.raw.tell())
+        etag = response.headers.get("ETag")
+        modified = response.headers.get("Last-Modified")
+        entry = Entry(item, self.timer(), etag, modified, sizeof(item))
+        self.__put(identifier, entry)
+        self.__store("put", identifier, item, etag=etag, modified=modified)
+        return item
+
+    def __revalidate(self, identifier, entry):
+        key = _key("revalidate", identifier)
+        try:
+            self.__flight(key, self.__fetch, identifier, entry)
+        except Exception as e:
+            logger.warning("Error revalidating %s: %s", identifier, e)
+        finally:
+            with self.lock:
+                self.__revalidating.discard(identifier)
+
+    def __search(self, query, fields, sort, rows, start):
         response = self.__get(
             "/advancedsearch.php",
             params={
@@ -75,12 +515,51 @@ class InternetArchiveClient:
         else:
             raise self.SearchError(response.url)
 
-    def __get(self, path, params=None):
-        return self.__session.get(
-            urllib.parse.urljoin(self.__base_url, path),
-            params=params,
-            timeout=self.__timeout,
-        )
+    def __decode(self, response):
+        if self.formats is None:
+            return response.json()
+        elif ijson is None:
+            return _filter(response.json(), self.formats)
+        else:
+            response.raw.decode_content = True
+            return _parse(response.raw, self.formats)
+
+    def __item(self, identifier, obj):
+        if not obj:
+            raise LookupError(identifier)
+        elif "error" in obj:
+            raise LookupError(obj["error"])
+        elif "result" in obj:
+            return obj["result"]
+        else:
+            return obj
+
+    def __get(self, path, params=None, headers=None, stream=False):
+        with self.lock:
+            self.__active += 1
+            if self.__active > self.__pool_maxsize:
+                self.stats["pool_saturated"] += 1
+            self.stats["active_max"] = max(self.stats["active_max"], self.__active)
+        start = time.monotonic()
+        try:
+            response = self.__session.get(
+                urllib.parse.urljoin(self.__base_url, path),
+                params=params,
+                headers=headers,
+                stream=stream,
+                timeout=self.__timeout,
+            )
+        finally:
+            with self.lock:
+                self.__active -= 1
+        latency = time.monotonic() - start
+        retries = getattr(response.raw, "retries", None)
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["retries"] += len(retries.history) if retries else 0
+            self.stats["latency"] += latency
+            self.stats["latency_max"] = max(self.stats["latency_max"], latency)
+        return response
 
     class SearchResult(Sequence):
         def __init__(self, result):
@@ -108,7 +587,6 @@ class InternetArchiveClient:
 
 if __name__ == "__main__":
     import argparse
-    import logging
     import json
     import sys
 
@@ -1,9 +1,18 @@
 import collections
+import concurrent.futures
 import logging
+import sqlite3
+import time
+
+import cachetools
 
 from mopidy import backend, models
 
-from . import Extension, translator
+from . import Extension, cache, translator
+
+BROWSE_LIMIT = 10000
+
+WARMUP_WORKERS = 1
 
 logger = logging.getLogger(__name__)
 
@@ -19,28 +28,48 @@ class InternetArchiveLibraryProvider(backend.LibraryProvider):
         self.__collections = config["collections"]
         self.__audio_formats = config["audio_formats"]
         self.__image_formats = config["image_formats"]
+        self.__image_service = config["image_service"]
 
         self.__browse_filter = "(mediatype:collection OR format:(%s))" % (
             " OR ".join(map(translator.quote, config["audio_formats"]))
         )
-        self.__browse_limit = config["browse_limit"]
+        # browsing without a limit is capped at a single scrape page
+        self.__browse_limit = config["browse_limit"] or BROWSE_LIMIT
+        self.__browse_paginate = config["browse_paginate"]
         self.__browse_views = config["browse_views"]
+        self.__browse_cache = cache.create(**config)
 
         self.__search_filter = "format:(%s)" % (
             " OR ".join(map(translator.quote, config["audio_formats"]))
         )
         self.__search_limit = config["search_limit"]
         self.__search_order = config["search_order"]
+        self.__search_cache = cache.create(**config)
 
         self.__directories = collections.OrderedDict()
-        self.__lookup = {}  # track cache for faster lookup
+        self.__root = None  # pending root directories
+        self.__snapshot = None  # pending snapshot
+        self.__warmup = None  # warm-up executor and futures
+        self.__snapshot_ttl = config["cache_ttl"]
+        # track cache for faster lookup, sized by number of tracks or bytes
+        if config["cache_max_bytes"] is not None:
+            maxsize, getsizeof = config["cache_max_bytes"], cache.sizeof
+        else:
+            maxsize, getsizeof = config["track_cache_size"] or 0, len
+        # values are (item timestamp, trackmap) pairs for expiring tracks
+        self.__lookup = cachetools.LRUCache(
+            maxsize, getsizeof=lambda value: getsizeof(value[1])
+        )
 
     def browse(self, uri):
+        self.__restore()
         identifier, filename, query = translator.parse_uri(uri)
         if filename:
             return []
         elif identifier and query:
-            return self.__browse_collection(identifier, **query)
+            refs = self.__browse_collection(identifier, **query)
+            self.__prefetch(ref.uri for ref in refs if ref.type == models.Ref.ALBUM)
+            return refs
         elif identifier:
             return self.__browse_item(identifier)
         else:
@@ -57,90 +86,278 @@ class InternetArchiveLibraryProvider(backend.LibraryProvider):
                 logger.debug("Not retrieving images for %s", uri)
         # retrieve item images and map back to uris
         results = {}
+        if self.__image_service:
+            for identifier, uris in urimap.items():
+                results.update(dict.fromkeys(uris, self.__thumbnail(identifier)))
+            return results
+        items = self.backend.client.getitems(urimap.keys())
         for identifier, uris in urimap.items():
-            try:
-                item = self.backend.client.getitem(identifier)
-            except Exception as e:
-                logger.error("Error retrieving images for %s: %s", uris, e)
+            item = items[identifier]
+            if isinstance(item, Exception):
+                logger.error("Error retrieving images for %s: %s", uris, item)
             else:
                 results.update(dict.fromkeys(uris, self.__images(item)))
         return results
 
     def lookup(self, uri):
-        try:
-            return [self.__lookup[uri]]
-        except KeyError:
-            logger.debug("Lookup cache miss for %r", uri)
+        self.__restore()
         identifier, filename, _ = translator.parse_uri(uri)
         if identifier:
-            tracks = self.__tracks(self.backend.client.getitem(identifier))
-            self.__lookup = trackmap = {t.uri: t for t in tracks}
-            return [trackmap[uri]] if filename else tracks
+            trackmap = self.__trackmap(identifier)
+            return [trackmap[uri]] if filename else list(trackmap.values())
         else:
             return []
 
+    def lookup_many(self, uris):
+        """Look up multiple track URIs, retrieving their items concurrently.
+
+        Note that Mopidy core does not call this method; it is provided
+        for callers using the library provider directly.
+        """
+        self.__restore()
+        # map uris to item identifiers
+        urimap = collections.defaultdict(list)
+        results = {}
+        for uri in uris:
+            identifier, _, _ = translator.parse_uri(uri)
+            if identifier:
+                urimap[identifier].append(uri)
+            else:
+                results[uri] = []
+        # retrieve uncached items and map tracks back to uris
+        trackmaps = {}
+        for identifier in urimap:
+            trackmap = self.__cachedtracks(identifier)
+            if trackmap is not None:
+                trackmaps[identifier] = trackmap
+        items = self.backend.client.getitems(
+            [identifier for identifier in urimap if identifier not in trackmaps]
+        )
+        for identifier, item in items.items():
+            if isinstance(item, Exception):
+                logger.error("Error looking up %s: %s", identifier, item)
+            else:
+                trackmaps[identifier] = self.__trackmap(identifier, item)
+        for identifier, uris in urimap.items():
+            trackmap = trackmaps.get(identifier, {})
+            for uri in uris:
+                if translator.parse_uri(uri)[1]:
+                    results[uri] = [trackmap[uri]] if uri in trackmap else []
+                else:
+                    results[uri] = list(trackmap.values())
+        return results
+
     def refresh(self, uri=None):
+        self.__restore()
+        identifier = translator.parse_uri(uri)[0] if uri else None
+        if identifier:
+            # only refresh the given item or collection
+            return self.__refresh(identifier)
         client = self.backend.client
         if client.cache:
             client.cache.clear()
+        if client.store is not None:
+            try:
+                client.store.clear()
+            except sqlite3.Error as e:
+                logger.warning("Error clearing Internet Archive disk cache: %s", e)
+        if self.__browse_cache is not None:
+            self.__browse_cache.clear()
+        if self.__search_cache is not None:
+            self.__search_cache.clear()
         self.__directories.clear()
+        self.__root = None
         self.__lookup.clear()
 
+    def warmup(self):
+        """Retrieve root directories and collection views in the background.
+
+        Warm-up tasks use their own executor, so they do not delay
+        requests submitted to the client's workers.
+        """
+        if self.__warmup is None:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                WARMUP_WORKERS, thread_name_prefix="InternetArchiveWarmup"
+            )
+            self.__warmup = (executor, [])
+        executor, futures = self.__warmup
+        if not self.__directories and self.__root is None:
+            self.__root = executor.submit(self.__search_root)
+            futures.append(self.__root)
+        if self.__browse_cache is None:
+            return
+        for identifier in self.__collections:
+            for order in self.__browse_views:
+                key = (identifier, (order,), self.__browse_limit, None, 0)
+                if key not in self.__browse_cache:
+                    future = executor.submit(self.__browse_page, identifier, (order,))
+                    self.__browse_cache[key] = future
+                    futures.append(future)
+
+    def close(self):
+        """Cancel pending warm-up tasks."""
+        if self.__warmup is not None:
+            executor, futures = self.__warmup
+            # cancel_futures requires Python 3.9
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+            self.__warmup = None
+
+    def restore(self, snapshot):
+        """Restore root directories and cached tracks from a snapshot.
+
+        This is deferred until the library is first used, so the
+        snapshot can be loaded in the background.
+        """
+        self.__snapshot = snapshot
+
+    def snapshot(self):
+        """Return root directories and cached tracks for saving."""
+        self.__restore()
+        return {
+            "collections": list(self.__collections),
+            "directories": list(self.__directories.values()),
+            "tracks": {
+                k: (timestamp, list(v.values()))
+                for k, (timestamp, v) in self.__lookup.items()
+            },
+        }
+
     def search(self, query=None, uris=None, exact=False):
         # sanitize uris
         uris = set(uris or [self.root_directory.uri])
         if self.root_directory.uri in uris:
             uris.update(translator.uri(c) for c in self.__collections)
             uris.remove(self.root_directory.uri)
-        # translate query
+        # normalize and translate query
+        query = {k: sorted(set(v)) for k, v in sorted((query or {}).items())}
         try:
-            qs = translator.query(query, uris, exact)
+            qs = translator.query(query, sorted(uris), exact)
         except ValueError as e:
             logger.info("Not searching %s: %s", Extension.dist_name, e)
             return None
         else:
             logger.debug("Internet Archive query: %s" % qs)
+        # check for cached results; keyed by uris for refreshing
+        fields = ("identifier", "title", "creator", "date")
+        key = (
+            tuple(sorted(uris)),
+            qs,
+            self.__search_filter,
+            fields,
+            self.__search_order,
+            self.__search_limit,
+        )
+        if self.__search_cache is not None:
+            result = self.__search_cache.get(key)
+            if result is not None:
+                self.__prefetch(album.uri for album in result.albums)
+                return result
         # fetch results
         result = self.backend.client.search(
             f"{qs} AND {self.__search_filter}",
-            fields=["identifier", "title", "creator", "date"],
+            fields=list(fields),
             rows=self.__search_limit,
             sort=self.__search_order,
         )
         logger.debug("Internet Archive result: %s" % list(result))
-        return models.SearchResult(
+        result = models.SearchResult(
             uri=translator.uri(q=result.query),
             albums=[translator.album(item) for item in result],
         )
+        if self.__search_cache is not None:
+            self.__cache(self.__search_cache, key, result)
+        self.__prefetch(album.uri for album in result.albums)
+        return result
 
-    def __browse_collection(self, identifier, sort=("downloads desc",)):
-        return [
-            translator.ref(res)
-            for res in self.backend.client.search(
+    def __browse_collection(
+        self, identifier, sort=("downloads desc",), cursor=(None,), start=("0",)
+    ):
+        sort, cursor, start = tuple(sort), cursor[0], int(start[0])
+        key = (identifier, sort, self.__browse_limit, cursor, start)
+        refs = position = None
+        if self.__browse_cache is not None:
+            refs = self.__browse_cache.get(key)
+        if isinstance(refs, concurrent.futures.Future):
+            try:
+                refs, position = refs.result()
+            except Exception as e:
+                logger.warning("Error prefetching %s: %s", identifier, e)
+                refs = None
+        if refs is None:
+            refs, position = self.__browse_page(identifier, sort, cursor, start)
+        if self.__browse_cache is not None:
+            self.__cache(self.__browse_cache, key, refs)
+            # prefetch next page in the background
+            if position is not None:
+                key = (identifier, sort, self.__browse_limit) + position
+                if key not in self.__browse_cache:
+                    self.__browse_cache[key] = self.backend.client.submit(
+                        self.__browse_page, identifier, sort, *position
+                    )
+        return list(refs)
+
+    def __browse_page(self, identifier, sort, cursor=None, start=0):
+        # returns page refs and the (cursor, start) position of the next
+        # page if there are more pages, so deep pages need not be scraped
+        # from the beginning
+        limit, docs = self.__browse_limit, []
+        while True:
+            items, next_cursor = self.backend.client.scrapepage(
                 f"collection:{identifier} AND {self.__browse_filter}",
                 fields=["identifier", "mediatype", "title", "creator"],
-                rows=self.__browse_limit,
                 sort=sort,
+                count=start + limit + 1 - len(docs),
+                cursor=cursor,
             )
-        ]
+            skip = min(start, len(items))
+            end = skip + limit - len(docs)
+            docs.extend(items[skip:end])
+            if len(items) > end:
+                position = (cursor, end)
+                break
+            cursor, start = next_cursor, start - skip
+            if cursor is None:
+                position = None
+                break
+            elif len(docs) == limit and not start:
+                position = (cursor, 0)
+                break
+        refs = [translator.ref(doc) for doc in docs]
+        if self.__browse_paginate and position is not None:
+            cursor, start = position
+            query = {"sort": sort, "start": start}
+            if cursor is not None:
+                query["cursor"] = cursor
+            uri = translator.uri(identifier, **query)
+            refs.append(models.Ref.directory(name="More...", uri=uri))
+            return refs, position
+        else:
+            return refs, None
 
     def __browse_item(self, identifier):
         if identifier in self.__directories:
             return self.__views(identifier)
-        item = self.backend.client.getitem(identifier)
-        if item["metadata"]["mediatype"] == "collection":
-            return self.__views(identifier)
-        tracks = self.__tracks(item)
-        self.__lookup = {t.uri: t for t in tracks}  # cache tracks
-        return [models.Ref.track(uri=t.uri, name=t.name) for t in tracks]
+        trackmap = self.__cachedtracks(identifier)
+        if trackmap is None:
+            item = self.backend.client.getitem(identifier)
+            if item["metadata"]["mediatype"] == "collection":
+                return self.__views(identifier)
+            trackmap = self.__trackmap(identifier, item)
+        return [models.Ref.track(uri=t.uri, name=t.name) for t in trackmap.values()]
 
     def __browse_root(self):
         if not self.__directories:
-            result = self.backend.client.search(
-                "mediatype:collection AND identifier:(%s)"
-                % (" OR ".join(self.__collections)),
-                fields=["identifier", "mediatype", "title"],
-            )
+            result = None
+            if self.__root is not None:
+                try:
+                    result = self.__root.result()
+                except Exception as e:
+                    logger.warning("Error prefetching root directories: %s", e)
+                self.__root = None
+            if result is None:
+                result = self.__search_root()
             objs = {obj["identifier"]: obj for obj in result}
             for identifier in self.__collections:
                 try:
@@ -151,15 +368,102 @@ class InternetArchiveLibraryProvider(backend.LibraryProvider):
                     self.__directories[identifier] = translator.ref(obj)
         return list(self.__directories.values())
 
+    def __cache(self, cache, key, value):
+        try:
+            cache[key] = value
+        except ValueError:
+            logger.debug("Not caching %r: value too large", key)
+
+    def __restore(self):
+        snapshot, self.__snapshot = self.__snapshot, None
+        if snapshot is None:
+            return
+        data = snapshot.load()
+        ttl = self.__snapshot_ttl
+        if ttl is not None and data["timestamp"] + ttl < time.time():
+            return
+        if data.get("collections") == list(self.__collections):
+            for ref in data.get("directories", []):
+                self.__directories[translator.parse_uri(ref.uri)[0]] = ref
+        for identifier, (timestamp, tracks) in data.get("tracks", {}).items():
+            try:
+                self.__lookup[identifier] = (timestamp, {t.uri: t for t in tracks})
+            except ValueError:
+                logger.debug("Not restoring %d tracks for %r", len(tracks), identifier)
+
+    def __search_root(self):
+        return self.backend.client.search(
+            "mediatype:collection AND identifier:(%s)"
+            % (" OR ".join(self.__collections)),
+            fields=["identifier", "mediatype", "title"],
+        )
+
     def __images(self, item):
         uri = self.backend.client.geturl  # get download URL for images
         return translator.images(item, self.__image_formats, uri)
 
+    def __thumbnail(self, identifier):
+        # only use item images if already cached
+        client = self.backend.client
+        item = client.peek(identifier)
+        if item is not None:
+            images = self.__images(item)
+            if images:
+                return images
+        return [models.Image(uri=client.getimageurl(identifier))]
+
     def __tracks(self, item, key=lambda t: (t.track_no or 0, t.uri)):
         tracks = translator.tracks(item, self.__audio_formats)
         tracks.sort(key=key)
         return tracks
 
+    def __prefetch(self, uris):
+        identifiers = [translator.parse_uri(uri)[0] for uri in uris]
+        self.backend.client.prefetch(identifiers)
+
+    def __refresh(self, identifier):
+        self.backend.client.evict(identifier)
+        if self.__browse_cache is not None:
+            for key in list(self.__browse_cache.keys()):
+                if key[0] == identifier:
+                    self.__browse_cache.pop(key, None)
+        if self.__search_cache is not None:
+            uri = translator.uri(identifier)
+            for key in list(self.__search_cache.keys()):
+                if uri in key[0]:
+                    self.__search_cache.pop(key, None)
+        self.__lookup.pop(identifier, None)
+
+    def __cachedtracks(self, identifier):
+        # tracks expire together with the item they were created from
+        try:
+            timestamp, trackmap = self.__lookup[identifier]
+        except KeyError:
+            return None
+        client = self.backend.client
+        if client.ttl is not None and timestamp + client.ttl < client.timer():
+            del self.__lookup[identifier]
+            return None
+        return trackmap
+
+    def __trackmap(self, identifier, item=None):
+        trackmap = self.__cachedtracks(identifier)
+        if trackmap is not None:
+            return trackmap
+        logger.debug("Lookup cache miss for %r", identifier)
+        client = self.backend.client
+        if item is None:
+            item = client.getitem(identifier)
+        trackmap = {t.uri: t for t in self.__tracks(item)}
+        timestamp = client.timestamp(identifier)
+        if timestamp is None:
+            timestamp = client.timer()
+        try:
+            self.__lookup[identifier] = (timestamp, trackmap)
+        except ValueError:
+            logger.debug("Not caching %d tracks for %r", len(trackmap), identifier)
+        return trackmap
+
     def __views(self, identifier):
         refs = []
         for order, name in self.__browse_views.items():
@@ -1,9 +1,82 @@
+import logging
+
 from mopidy import backend
 
 from . import translator
 
+logger = logging.getLogger(__name__)
+
 
 class InternetArchivePlaybackProvider(backend.PlaybackProvider):
+    def __init__(self, config, audio, backend):
+        super().__init__(audio, backend)
+        self.__prefetch = config["playback_prefetch"]
+        if self.__prefetch and not (
+            config["audio_cache_size"] or config["resolve_ttl"]
+        ):
+            logger.warning(
+                "playback_prefetch has no effect unless audio_cache_size "
+                "or resolve_ttl is set"
+            )
+            self.__prefetch = False
+
     def translate_uri(self, uri):
         identifier, filename, _ = translator.parse_uri(uri)
-        return self.backend.client.geturl(identifier, filename)
+        client = self.backend.client
+        url = client.geturl(identifier, filename)
+        if self.__prefetch:
+            self.__prepare(self.__next(uri))
+        if client.files is not None:
+            path = client.files.get(f"{identifier}/{filename}")
+            if path is not None:
+                return path.as_uri()
+            self.__download(identifier, filename, url)
+        # never delay playback waiting for the redirect
+        return client.resolve(url, block=False)
+
+    def __download(self, identifier, filename, url):
+        # file metadata may have to be retrieved, so not on the actor thread
+        self.backend.client.submit(self.__fetch, identifier, filename, url)
+
+    def __fetch(self, identifier, filename, url):
+        try:
+            obj = self.__file(identifier, filename)
+        except Exception as e:
+            logger.warning("Not caching %s: %s", url, e)
+        else:
+            key = f"{identifier}/{filename}"
+            self.backend.client.files.fetch(key, url, obj.get("size"), obj.get("md5"))
+
+    def __file(self, identifier, filename):
+        item = self.backend.client.getitem(identifier)
+        for obj in item["files"]:
+            if obj["name"] == filename:
+                return obj
+        raise LookupError(filename)
+
+    def __next(self, uri):
+        # next track of the same item, in track number order
+        identifier, _, _ = translator.parse_uri(uri)
+        if self.backend.client.peek(identifier) is None:
+            return None  # do not delay playback by retrieving metadata
+        try:
+            tracks = self.backend.library.lookup(translator.uri(identifier))
+            uris = [t.uri for t in tracks]
+            return uris[uris.index(uri) + 1]
+        except Exception as e:
+            logger.debug("No next track for %s: %s", uri, e)
+            return None
+
+    def __prepare(self, uri):
+        # resolve and download next track in the background
+        if uri is None:
+            return
+        identifier, filename, _ = translator.parse_uri(uri)
+        client = self.backend.client
+        url = client.geturl(identifier, filename)
+        if client.files is not None:
+            if client.files.get(f"{identifier}/{filename}") is not None:
+                return
+            self.__download(identifier, filename, url)
+        if client.urls is not None:
+            client.submit(client.resolve, url)
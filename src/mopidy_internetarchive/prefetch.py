@@ -0,0 +1,61 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Low-priority background prefetcher.
+
+    Keys passed to `prefetch()` are handed to `func` one at a time by a
+    single background thread, waiting `delay` seconds after each call
+    that returns a true value.  At most `maxsize` keys are pending, and
+    each call to `prefetch()` cancels any keys still pending from the
+    previous call.
+
+    """
+
+    def __init__(self, func, maxsize, delay=0, name=None):
+        self.__func = func
+        self.__queue = queue.Queue(maxsize)
+        self.__delay = delay
+        self.__generation = 0
+        self.__thread = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.__thread.start()
+
+    def prefetch(self, keys):
+        generation = self.cancel()
+        for key in keys:
+            try:
+                self.__queue.put_nowait((generation, key))
+            except queue.Full:
+                break
+
+    def cancel(self):
+        self.__generation += 1
+        while True:
+            try:
+                self.__queue.get_nowait()
+            except queue.Empty:
+                break
+        return self.__generation
+
+    def stop(self):
+        self.cancel()
+        self.__queue.put(None)
+
+    def __run(self):
+        while True:
+            entry = self.__queue.get()
+            if entry is None:
+                break
+            generation, key = entry
+            if generation != self.__generation:
+                continue
+            try:
+                if self.__func(key):
+                    time.sleep(self.__delay)
+            except Exception as e:
+                logger.debug("Error prefetching %s: %s", key, e)
@@ -1,5 +1,6 @@
 import collections
 import datetime
+import functools
 import logging
 import re
 
@@ -42,6 +43,27 @@ _QUERYMAP = {
     ),
 }
 
+# item metadata and file keys used for translation
+ITEM_FIELDS = {
+    "metadata": ("identifier", "mediatype", "title", "artist", "creator", "date"),
+    "files": (
+        "name",
+        "format",
+        "original",
+        "source",
+        "title",
+        "track",
+        "length",
+        "bitrate",
+        "mtime",
+        "genre",
+        "artist",
+        "creator",
+        "md5",
+        "size",
+    ),
+}
+
 logger = logging.getLogger(__name__)
 
 
@@ -126,22 +148,34 @@ def ref(obj, uri=uri):
         return Ref.album(name=name(obj), uri=uri(identifier))
 
 
+# Mopidy already shares identical model instances, but these memos
+# also avoid their repeated construction and validation
+@functools.lru_cache(maxsize=1024)
+def _artist(name):
+    return Artist(name=name)
+
+
+@functools.lru_cache(maxsize=1024)
+def _album(uri, name, artists, date):
+    return Album(uri=uri, name=name, artists=artists, date=date)
+
+
 def artists(obj):
     artist = obj.get("artist", obj.get("creator"))
     if not artist:
         return None
     elif isinstance(artist, str):
-        return [Artist(name=artist)]
+        return [_artist(artist)]
     else:
-        return [Artist(name=name) for name in artist]
+        return [_artist(name) for name in artist]
 
 
 def album(obj, uri=uri):
-    return Album(
-        uri=uri(obj["identifier"]),
-        name=name(obj),
-        artists=artists(obj),
-        date=parse_date(obj.get("date")),
+    return _album(
+        uri(obj["identifier"]),
+        name(obj),
+        tuple(artists(obj) or ()),
+        parse_date(obj.get("date")),
     )
 
 
@@ -1,4 +1,10 @@
 import collections
+import concurrent.futures
+import http.server
+import json
+import threading
+import time
+import urllib.parse
 from unittest import mock
 
 import mopidy_internetarchive as ext
@@ -6,27 +12,55 @@ import mopidy_internetarchive as ext
 import pytest
 
 
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "internetarchive(**kwargs): override extension config values"
+    )
+
+
 @pytest.fixture
-def config():
-    return {
+def config(request):
+    config = {
         "internetarchive": {
             "base_url": "http://archive.org",
             "collections": ("audio", "etree", "foo"),
             "audio_formats": ("Flac", "VBR MP3"),
             "image_formats": ("JPEG", "PNG"),
+            "image_service": False,
             "browse_limit": None,
+            "browse_paginate": False,
+            "browse_warmup": False,
             "browse_views": collections.OrderedDict(
                 [("title asc", "Title"), ("creator asc", "Creator")]
             ),
             "search_limit": None,
             "search_order": None,
             "cache_size": None,
+            "cache_max_bytes": None,
             "cache_ttl": None,
+            "cache_stale_ttl": None,
+            "cache_snapshot": False,
+            "disk_cache_size": None,
+            "resolve_ttl": None,
+            "audio_cache_size": None,
+            "playback_prefetch": False,
+            "track_cache_size": 10,
+            "prefetch_count": None,
+            "prefetch_delay": 0,
             "retries": 0,
+            "retry_backoff": 0,
+            "retry_jitter": 0,
             "timeout": None,
+            "concurrency": 1,
+            "pool_connections": 1,
+            "pool_maxsize": 1,
+            "keep_alive": True,
         },
         "proxy": {},
     }
+    for marker in request.node.iter_markers("internetarchive"):
+        config["internetarchive"].update(marker.kwargs)
+    return config
 
 
 @pytest.fixture
@@ -50,6 +84,34 @@ def client_mock():
     client_mock = mock.Mock(spec=ext.client.InternetArchiveClient)
     client_mock.SearchResult = ext.client.InternetArchiveClient.SearchResult
     client_mock.cache = mock.Mock(spec=dict)
+    client_mock.store = mock.Mock(spec=dict)
+    client_mock.files = None
+    client_mock.ttl = None
+    client_mock.timer = time.time
+    client_mock.timestamp.return_value = None
+
+    def getitems(identifiers):
+        results = {}
+        for identifier in identifiers:
+            try:
+                results[identifier] = client_mock.getitem(identifier)
+            except Exception as e:
+                results[identifier] = e
+        return results
+
+    client_mock.getitems.side_effect = getitems
+    client_mock.resolve.side_effect = lambda url, block=True: url
+    client_mock.scrapepage.return_value = ([], None)
+
+    def submit(func, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    client_mock.submit.side_effect = submit
     client_mock.search.return_value = client_mock.SearchResult(
         {
             "responseHeader": {"params": {"q": "album"}},
@@ -80,6 +142,12 @@ def backend_mock(client_mock, config):
     return backend_mock
 
 
+@pytest.fixture
+def backend(audio_mock, config, tmp_path):
+    config["core"] = {"cache_dir": str(tmp_path)}
+    return ext.backend.InternetArchiveBackend(config, audio_mock)
+
+
 @pytest.fixture
 def library(backend_mock, config):
     return ext.library.InternetArchiveLibraryProvider(
@@ -88,5 +156,66 @@ def library(backend_mock, config):
 
 
 @pytest.fixture
-def playback(audio_mock, backend_mock):
-    return ext.playback.InternetArchivePlaybackProvider(audio_mock, backend_mock)
+def playback(audio_mock, backend_mock, config):
+    return ext.playback.InternetArchivePlaybackProvider(
+        config["internetarchive"], audio_mock, backend_mock
+    )
+
+
+class ArchiveRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Stand-in for the archive.org metadata and scrape APIs."""
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        self.server.requests.append((url.path, params))
+        if self.server.errors:
+            self.send_response(self.server.errors.pop(0))
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif url.path == "/services/search/v1/scrape":
+            self.scrape(params)
+        elif url.path.startswith("/metadata/"):
+            identifier = url.path.rpartition("/")[2]
+            self.reply(self.server.items.get(identifier, {}))
+        else:
+            self.send_error(404)
+
+    def scrape(self, params):
+        count = int(params["count"][0])
+        if count < 100:
+            return self.reply({"error": "count must be at least 100"})
+        start = int(params.get("cursor", ["0"])[0])
+        end = start + count
+        items = self.server.docs[start:end]
+        obj = {"items": items, "count": len(items), "total": len(self.server.docs)}
+        if end < len(self.server.docs):
+            obj["cursor"] = str(end)
+        self.reply(obj)
+
+    def reply(self, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def archive_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ArchiveRequestHandler)
+    server.docs = []
+    server.items = {}
+    server.requests = []
+    server.errors = []
+    server.url = "http://%s:%d/" % server.server_address
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
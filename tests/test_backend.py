@@ -0,0 +1,31 @@
+import time
+
+from mopidy_internetarchive import Extension, cache
+from mopidy_internetarchive.cache import Entry, Snapshot
+
+import pytest
+
+ITEM = {
+    "files": [{"name": "track01.mp3", "format": "VBR MP3"}],
+    "metadata": {"identifier": "album", "title": "Album", "mediatype": "audio"},
+}
+
+
+@pytest.mark.internetarchive(cache_size=8, cache_snapshot=True)
+def test_snapshot(backend, config):
+    path = Extension.get_cache_dir(config) / "snapshot.json.gz"
+    entries = [
+        ("album", Entry(ITEM, time.time(), '"1"', None, 1)),
+        ("other", Entry(ITEM, time.time(), None, None, 1)),
+    ]
+    Snapshot(path).save(entries)
+    backend.on_start()
+    # items are restored when first retrieved
+    assert backend.client.getitem("album") == ITEM
+    assert backend.client.cache["album"].etag == '"1"'
+    assert backend.client.stats["restored"] == 1
+    assert backend.client.stats["requests"] == 0
+    # cached and unrestored items are saved on shutdown
+    backend.on_stop()
+    snapshot = cache.load(path)
+    assert sorted(key for key, *_ in snapshot["items"]) == ["album", "other"]
@@ -1,5 +1,9 @@
 from mopidy import models
 
+from mopidy_internetarchive.library import BROWSE_LIMIT
+
+import pytest
+
 COLLECTION = {
     "metadata": {
         "identifier": "directory",
@@ -53,6 +57,22 @@ def test_browse_root_directory(library, client_mock, root_collections):
     assert results == root_collections
 
 
+@pytest.mark.internetarchive(cache_size=128)
+def test_browse_warmup(library, client_mock, root_collections):
+    library.warmup()
+    # warm-up does not use the client's workers
+    client_mock.submit.assert_not_called()
+    # root search plus two views of three collections, in order
+    library.browse("internetarchive:foo?sort=creator%20asc")
+    assert client_mock.search.call_count == 1
+    assert client_mock.scrapepage.call_count == 6
+    assert library.browse(library.root_directory.uri) == root_collections
+    library.browse("internetarchive:etree?sort=creator%20asc")
+    assert client_mock.search.call_count == 1
+    assert client_mock.scrapepage.call_count == 6
+    library.close()
+
+
 def test_browse_collection(library, client_mock):
     client_mock.getitem.return_value = COLLECTION
     results = library.browse("internetarchive:directory")
@@ -78,28 +98,23 @@ def test_browse_video(library, client_mock):
 
 
 def test_browse_view(library, client_mock):
-    client_mock.search.return_value = client_mock.SearchResult(
-        {
-            "responseHeader": {"params": {"q": "album"}},
-            "response": {
-                "docs": [
-                    {
-                        "identifier": "album",
-                        "title": "Album",
-                        "mediatype": "audio",
-                    },
-                    {
-                        "identifier": "directory",
-                        "title": "Directory",
-                        "mediatype": "collection",
-                    },
-                ],
-                "numFound": 2,
+    client_mock.scrapepage.return_value = (
+        [
+            {
+                "identifier": "album",
+                "title": "Album",
+                "mediatype": "audio",
+            },
+            {
+                "identifier": "directory",
+                "title": "Directory",
+                "mediatype": "collection",
             },
-        }
+        ],
+        None,
     )
     results = library.browse("internetarchive:audio?sort=title%20asc")
-    library.backend.client.search.assert_called_once()
+    library.backend.client.scrapepage.assert_called_once()
     assert results == [
         models.Ref.album(name="Album", uri="internetarchive:album"),
         models.Ref.directory(name="Directory", uri="internetarchive:directory"),
@@ -111,3 +126,93 @@ def test_browse_file(library, client_mock):
     client_mock.getitem.assert_not_called()
     client_mock.search.assert_not_called()
     assert results == []
+
+
+@pytest.mark.internetarchive(cache_size=128)
+def test_browse_view_cache(library, client_mock):
+    library.browse("internetarchive:audio?sort=title%20asc")
+    library.browse("internetarchive:audio?sort=title%20asc")
+    client_mock.scrapepage.assert_called_once()
+    library.browse("internetarchive:audio?sort=creator%20asc")
+    library.browse("internetarchive:etree?sort=title%20asc")
+    assert client_mock.scrapepage.call_count == 3
+    # refresh only clears the given collection
+    library.refresh("internetarchive:audio")
+    client_mock.evict.assert_called_once_with("audio")
+    client_mock.scrapepage.reset_mock()
+    library.browse("internetarchive:audio?sort=title%20asc")
+    library.browse("internetarchive:etree?sort=title%20asc")
+    client_mock.scrapepage.assert_called_once()
+    # refresh all
+    library.refresh()
+    client_mock.scrapepage.reset_mock()
+    library.browse("internetarchive:etree?sort=title%20asc")
+    client_mock.scrapepage.assert_called_once()
+
+
+@pytest.mark.internetarchive(browse_limit=2, browse_paginate=True, cache_size=128)
+def test_browse_paginate(library, client_mock):
+    docs = [
+        {"identifier": "album%d" % n, "title": "Album #%d" % n, "mediatype": "audio"}
+        for n in range(7)
+    ]
+
+    def scrapepage(query, fields=None, sort=None, count=None, cursor=None):
+        start = int(cursor or 0)
+        end = start + 3
+        return docs[start:end], str(end) if end < len(docs) else None
+
+    client_mock.scrapepage.side_effect = scrapepage
+    results = library.browse("internetarchive:audio?sort=title%20asc")
+    assert results == [
+        models.Ref.album(name="Album #0", uri="internetarchive:album0"),
+        models.Ref.album(name="Album #1", uri="internetarchive:album1"),
+        models.Ref.directory(
+            name="More...", uri="internetarchive:audio?sort=title%20asc&start=2"
+        ),
+    ]
+    assert client_mock.scrapepage.call_args_list[0][1]["count"] == 3
+    # next page is prefetched in the background
+    client_mock.submit.assert_called_once()
+    assert client_mock.scrapepage.call_count == 3
+    results = library.browse("internetarchive:audio?sort=title%20asc&start=2")
+    assert results == [
+        models.Ref.album(name="Album #2", uri="internetarchive:album2"),
+        models.Ref.album(name="Album #3", uri="internetarchive:album3"),
+        models.Ref.directory(
+            name="More...",
+            uri="internetarchive:audio?sort=title%20asc&start=1&cursor=3",
+        ),
+    ]
+    results = library.browse("internetarchive:audio?sort=title%20asc&start=1&cursor=3")
+    assert results[:2] == [
+        models.Ref.album(name="Album #4", uri="internetarchive:album4"),
+        models.Ref.album(name="Album #5", uri="internetarchive:album5"),
+    ]
+    assert results[2].uri == "internetarchive:audio?sort=title%20asc&start=0&cursor=6"
+    assert client_mock.scrapepage.call_count == 5
+    # deep pages are retrieved starting at their cursor after a refresh
+    library.refresh()
+    client_mock.scrapepage.reset_mock()
+    results = library.browse("internetarchive:audio?sort=title%20asc&start=0&cursor=6")
+    assert results == [
+        models.Ref.album(name="Album #6", uri="internetarchive:album6"),
+    ]
+    client_mock.scrapepage.assert_called_once()
+    assert client_mock.scrapepage.call_args[1]["cursor"] == "6"
+
+
+def test_browse_unlimited(library, client_mock):
+    def scrapepage(query, fields=None, sort=None, count=None, cursor=None):
+        start = int(cursor or 0)
+        docs = [
+            {"identifier": "album%d" % n, "mediatype": "audio"}
+            for n in range(start, start + 1000)
+        ]
+        return docs, str(start + 1000)
+
+    client_mock.scrapepage.side_effect = scrapepage
+    # browsing without a limit does not retrieve the whole collection
+    results = library.browse("internetarchive:audio?sort=title%20asc")
+    assert len(results) == BROWSE_LIMIT
+    assert client_mock.scrapepage.call_count == BROWSE_LIMIT // 1000
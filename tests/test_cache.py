@@ -0,0 +1,156 @@
+import hashlib
+import threading
+
+from mopidy_internetarchive import cache
+from mopidy_internetarchive.cache import FileCache, MetadataStore
+
+import pytest
+
+ITEM = {
+    "files": [{"name": "track01.mp3", "format": "VBR MP3"}],
+    "metadata": {"identifier": "album", "title": "Album", "mediatype": "audio"},
+}
+
+
+class Timer:
+    def __init__(self, time=0):
+        self.time = time
+
+    def __call__(self):
+        return self.time
+
+
+def test_create():
+    assert cache.create() is None
+    assert cache.create(cache_size=2).maxsize == 2
+    assert cache.create(cache_size=2, cache_ttl=60).ttl == 60
+
+
+def test_create_max_bytes():
+    c = cache.create(cache_size=2, cache_max_bytes=64)
+    c["a"] = {"files": [], "metadata": {"identifier": "a"}}
+    assert c.maxsize == 64
+    assert c.currsize == len('{"files":[],"metadata":{"identifier":"a"}}')
+    c["b"] = {"files": [], "metadata": {"identifier": "b"}}
+    assert list(c) == ["b"]
+    with pytest.raises(ValueError):
+        c["c"] = {"files": [{"name": "x" * 64}]}
+
+
+def test_create_getsizeof():
+    c = cache.create(cache_size=2, cache_max_bytes=64, getsizeof=len)
+    c["a"] = "x" * 32
+    assert c.currsize == 32
+    # getsizeof is only used for memory-bounded caches
+    assert cache.create(cache_size=2, getsizeof=len).getsizeof("x" * 32) == 1
+
+
+def test_store(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db", 2)
+    assert len(store) == 0
+    store["album"] = ITEM
+    assert len(store) == 1
+    assert "album" in store
+    assert store["album"] == ITEM
+    assert list(store) == ["album"]
+    del store["album"]
+    assert "album" not in store
+    with pytest.raises(KeyError):
+        del store["album"]
+
+
+def test_store_persistent(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db", 2)
+    store["album"] = ITEM
+    store.close()
+    store = MetadataStore(tmp_path / "metadata.db", 2)
+    assert store["album"] == ITEM
+
+
+def test_store_ttl(tmp_path):
+    timer = Timer()
+    store = MetadataStore(tmp_path / "metadata.db", 2, ttl=10, timer=timer)
+    store["album"] = ITEM
+    timer.time = 10
+    assert store["album"] == ITEM
+    timer.time = 11
+    with pytest.raises(KeyError):
+        store["album"]
+    # expired entries are retained for revalidation
+    entry = store.entry("album")
+    assert entry.value == ITEM
+    assert store.expired(entry)
+    store.touch("album")
+    assert store["album"] == ITEM
+
+
+def test_store_validators(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db", 2)
+    store.put("album", ITEM, etag='"etag"', modified="Thu, 01 Jan 2015")
+    entry = store.entry("album")
+    assert entry.value == ITEM
+    assert entry.etag == '"etag"'
+    assert entry.modified == "Thu, 01 Jan 2015"
+    assert entry.size > 0
+    assert store.entry("foo") is None
+
+
+def test_store_maxsize(tmp_path):
+    timer = Timer()
+    store = MetadataStore(tmp_path / "metadata.db", 2, timer=timer)
+    store["a"] = ITEM
+    timer.time = 1
+    store["b"] = ITEM
+    timer.time = 2
+    assert store["a"] == ITEM
+    timer.time = 3
+    store["c"] = ITEM
+    assert sorted(store) == ["a", "c"]
+
+
+def test_files(tmp_path):
+    def download(url, f):
+        f.write(url.encode())
+
+    files = FileCache(tmp_path, 64, download)
+    url = "http://archive.org/download/album/track01.mp3"
+    md5 = hashlib.md5(url.encode()).hexdigest()
+    assert files.get("album/track01.mp3") is None
+    files.fetch("album/track01.mp3", url, str(len(url)), md5).result()
+    path = files.get("album/track01.mp3")
+    assert path.suffix == ".mp3"
+    assert path.read_bytes() == url.encode()
+    # cached files are not downloaded again
+    assert files.fetch("album/track01.mp3", url) is None
+    # files not matching size or checksum are discarded
+    files.fetch("album/track02.mp3", url, len(url) + 1).result()
+    files.fetch("album/track03.mp3", url, md5="0" * 32).result()
+    assert files.get("album/track02.mp3") is None
+    assert files.get("album/track03.mp3") is None
+    assert list(tmp_path.iterdir()) == [path]
+    # files larger than maxsize are not downloaded
+    assert files.fetch("album/track04.mp3", url, 65) is None
+    # least recently used files are removed
+    files.fetch("album/track05.mp3", url).result()
+    assert files.get("album/track01.mp3") is None
+    assert files.get("album/track05.mp3") is not None
+    files.close()
+
+
+def test_files_close(tmp_path):
+    started = threading.Event()
+
+    def download(url, f):
+        started.set()
+        while True:
+            f.write(b"x")  # raises once closed
+
+    files = FileCache(tmp_path, 64, download)
+    future = files.fetch("album/track01.mp3", "track01.mp3")
+    queued = files.fetch("album/track02.mp3", "track02.mp3")
+    assert started.wait(5)
+    files.close()
+    future.result(5)
+    assert queued.cancelled()
+    assert files.get("album/track01.mp3") is None
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,336 @@
+import copy
+import io
+import json
+import sqlite3
+import threading
+import time
+from unittest import mock
+
+from mopidy_internetarchive import client as client_module
+from mopidy_internetarchive.cache import MetadataStore
+from mopidy_internetarchive.client import InternetArchiveClient
+
+import pytest
+
+ITEM = {
+    "files": [{"name": "track01.mp3", "format": "VBR MP3"}],
+    "metadata": {"identifier": "album", "title": "Album", "mediatype": "audio"},
+}
+
+FILES = {
+    "files": [
+        {"name": "track01.mp3", "format": "VBR MP3", "length": "1.5"},
+        {"name": "track01.flac", "format": "Flac", "source": "original"},
+        {"name": "track01.png", "format": "PNG", "source": "derivative"},
+    ],
+    "metadata": {"identifier": "album", "title": "Album", "mediatype": "audio"},
+    "server": "ia800000.us.archive.org",
+}
+
+
+def response(status_code=200, json=None, headers=None):
+    response = mock.MagicMock(status_code=status_code, headers=headers or {})
+    response.__enter__.return_value = response
+    response.raw.retries = None
+    response.raw.tell.return_value = 2 if json else 0
+    response.json.return_value = json
+    return response
+
+
+@pytest.fixture
+def get_mock():
+    with mock.patch("requests.Session.get") as get_mock:
+        yield get_mock
+
+
+@pytest.fixture
+def client():
+    client = InternetArchiveClient("http://archive.org")
+    client.cache = {}
+    return client
+
+
+def test_getitem(client, get_mock):
+    get_mock.return_value = response(json=ITEM)
+    assert client.getitem("album") == ITEM
+    assert get_mock.call_args[0] == ("http://archive.org/metadata/album",)
+    assert client.stats["misses"] == 1
+
+
+def test_getitem_error(client, get_mock):
+    get_mock.return_value = response(json={"error": "not found"})
+    with pytest.raises(LookupError):
+        client.getitem("album")
+
+
+def test_getitem_revalidate(client, get_mock):
+    client.timer = timer = mock.Mock(return_value=0)
+    client.ttl = 10
+    get_mock.return_value = response(json=ITEM, headers={"ETag": '"1"'})
+    assert client.getitem("album") == ITEM
+    assert client.getitem("album") == ITEM
+    assert get_mock.call_count == 1
+    # expired entries are kept in memory for revalidation
+    timer.return_value = 11
+    get_mock.return_value = response(304)
+    assert client.getitem("album") == ITEM
+    assert get_mock.call_args[1]["headers"] == {"If-None-Match": '"1"'}
+    assert client.stats["revalidated"] == 1
+    assert client.stats["revalidated_bytes"] > 0
+    assert client.cache["album"].timestamp == 11
+
+
+def test_getitem_store(client, get_mock):
+    client.timer = timer = mock.Mock(return_value=0)
+    client.ttl = 10
+    client.store = MetadataStore(":memory:", 1, ttl=10, timer=timer)
+    get_mock.return_value = response(json=ITEM, headers={"ETag": '"1"'})
+    assert client.getitem("album") == ITEM
+    assert get_mock.call_count == 1
+    # items evicted from memory are retrieved from store
+    client.cache.clear()
+    assert client.getitem("album") == ITEM
+    assert get_mock.call_count == 1
+    assert client.stats["store_hits"] == 1
+    # memory hits are counted separately
+    assert client.getitem("album") == ITEM
+    assert client.stats["store_hits"] == 1
+    assert client.stats["hits"] == 1
+    # expired store entries are revalidated
+    client.cache.clear()
+    timer.return_value = 11
+    get_mock.return_value = response(304)
+    assert client.getitem("album") == ITEM
+    assert get_mock.call_args[1]["headers"] == {"If-None-Match": '"1"'}
+    assert client.store["album"] == ITEM
+
+
+def test_getitem_store_error(client, get_mock):
+    client.store = mock.Mock(spec=MetadataStore)
+    client.store.entry.side_effect = sqlite3.OperationalError("database is locked")
+    client.store.put.side_effect = sqlite3.OperationalError("disk is full")
+    get_mock.return_value = response(json=ITEM)
+    # disk cache errors do not prevent retrieving items
+    assert client.getitem("album") == ITEM
+    client.store.put.assert_called_once()
+
+
+def test_getitem_stale(client, get_mock):
+    client.timer = timer = mock.Mock(return_value=0)
+    client.ttl = 10
+    client.stale_ttl = 10
+    get_mock.return_value = response(json=ITEM, headers={"ETag": '"1"'})
+    assert client.getitem("album") == ITEM
+    # stale items are revalidated in the background
+    timer.return_value = 15
+    get_mock.return_value = response(json={"metadata": {}, "files": []})
+    assert client.getitem("album") == ITEM
+    client.submit(lambda: None).result()  # wait for background revalidation
+    assert get_mock.call_count == 2
+    assert client.stats["stale"] == 1
+    assert client.getitem("album") == {"metadata": {}, "files": []}
+    # items beyond stale ttl are revalidated in the foreground
+    timer.return_value = 40
+    get_mock.return_value = response(json=ITEM)
+    assert client.getitem("album") == ITEM
+    assert client.stats["stale"] == 1
+
+
+def test_getitem_stale_queued(client, get_mock):
+    client.timer = timer = mock.Mock(return_value=0)
+    client.ttl = 10
+    client.stale_ttl = 10
+    get_mock.return_value = response(json=ITEM)
+    client.getitem("album")
+    timer.return_value = 15
+    resume = threading.Event()
+    client.submit(resume.wait, 5)  # keep worker busy
+    for _ in range(3):
+        assert client.getitem("album") == ITEM
+    resume.set()
+    client.submit(lambda: None).result()  # wait for background revalidation
+    # queued revalidations are not submitted again
+    assert get_mock.call_count == 2
+    assert client.stats["stale"] == 3
+
+
+def test_getitems(client, get_mock):
+    def get(url, **kwargs):
+        if url.endswith("/null"):
+            return response(json={})
+        else:
+            return response(json=ITEM)
+
+    get_mock.side_effect = get
+    results = client.getitems(["album", "null", "album"])
+    assert get_mock.call_count == 2
+    assert results["album"] == ITEM
+    assert isinstance(results["null"], LookupError)
+    # cached items are not fetched again
+    assert client.getitems(["album"]) == {"album": ITEM}
+    assert get_mock.call_count == 2
+
+
+def test_scrape(archive_server):
+    archive_server.docs = [{"identifier": "item%d" % n} for n in range(250)]
+    client = InternetArchiveClient(archive_server.url)
+    docs = client.scrape("collection:etree", fields=["identifier"], count=1)
+    assert next(docs) == {"identifier": "item0"}
+    # results are retrieved lazily
+    assert len(archive_server.requests) == 1
+    assert list(docs) == archive_server.docs[1:]
+    assert len(archive_server.requests) == 3
+    path, params = archive_server.requests[-1]
+    assert path == "/services/search/v1/scrape"
+    assert params["count"] == ["100"]
+    assert params["cursor"] == ["200"]
+    assert params["fields"] == ["identifier"]
+
+
+def test_scrape_error(archive_server):
+    client = InternetArchiveClient(archive_server.url)
+    with mock.patch("mopidy_internetarchive.client.SCRAPE_COUNT", (1, 10)):
+        with pytest.raises(client.SearchError):
+            list(client.scrape("collection:etree", count=1))
+
+
+def test_session():
+    session = client_module._session("http://archive.org", retries=2)
+    adapter = session.get_adapter("http://archive.org/metadata/album")
+    assert adapter.max_retries.total == 2
+    # pooled adapter is also used for archive.org servers, but not others
+    assert session.get_adapter("https://ia800.us.archive.org/file.mp3") is adapter
+    assert session.get_adapter("http://archive.org.example.com/") is not adapter
+    assert session.get_adapter("http://example.com/") is not adapter
+
+
+def test_retry(archive_server):
+    archive_server.items["album"] = ITEM
+    archive_server.errors = [503, 429]
+    client = InternetArchiveClient(archive_server.url, retries=2)
+    client.cache = {}
+    assert client.getitem("album") == ITEM
+    assert len(archive_server.requests) == 3
+    assert client.stats["requests"] == 1
+    assert client.stats["retries"] == 2
+    assert client.stats["latency"] >= client.stats["latency_max"] > 0
+
+
+def test_getitem_filter(client, get_mock, monkeypatch):
+    monkeypatch.setattr(client_module, "ijson", None)
+    get_mock.return_value = response(json=copy.deepcopy(FILES))
+    client.formats = ["VBR MP3"]
+    assert client.getitem("album")["files"] == FILES["files"][:2]
+    assert get_mock.call_args[1]["stream"] is True
+
+
+def test_getitem_fields(client, get_mock):
+    get_mock.return_value = response(json=copy.deepcopy(FILES))
+    client.fields = {"metadata": ["identifier"], "files": ["name", "format"]}
+    assert client.getitem("album") == {
+        "metadata": {"identifier": "album"},
+        "files": [
+            {"name": "track01.mp3", "format": "VBR MP3"},
+            {"name": "track01.flac", "format": "Flac"},
+            {"name": "track01.png", "format": "PNG"},
+        ],
+    }
+
+
+def test_getitem_stream(archive_server):
+    pytest.importorskip("ijson")
+    archive_server.items["album"] = FILES
+    client = InternetArchiveClient(archive_server.url)
+    client.cache = {}
+    client.formats = ["VBR MP3"]
+    item = client.getitem("album")
+    assert item["metadata"] == FILES["metadata"]
+    assert item["files"] == FILES["files"][:2]
+    assert item["server"] == FILES["server"]
+    assert client.stats["fetched_bytes"] > 0
+
+
+def test_parse():
+    pytest.importorskip("ijson")
+    obj = {
+        "result": {"metadata": {"identifier": "album"}, "files": []},
+        "server": "ia800.us.archive.org",
+        "workable_servers": ["ia800.us.archive.org"],
+        "reviews": None,
+        "files": [{"name": "track01.mp3", "format": "VBR MP3"}],
+    }
+    data = json.dumps(obj).encode()
+    # same top-level keys as response.json()
+    assert client_module._parse(io.BytesIO(data), ["VBR MP3"]) == json.loads(data)
+
+
+def test_getitem_coalesced(client, get_mock):
+    started = threading.Event()
+    resume = threading.Event()
+
+    def get(url, **kwargs):
+        started.set()
+        assert resume.wait(5)
+        return response(json=ITEM)
+
+    get_mock.side_effect = get
+    future = client.submit(client.getitem, "album")
+    assert started.wait(5)
+    waiter = threading.Thread(target=client.getitem, args=("album",))
+    waiter.start()
+    while not client.stats["coalesced"]:
+        time.sleep(0.01)
+    resume.set()
+    waiter.join(5)
+    assert future.result(5) == ITEM
+    assert get_mock.call_count == 1
+
+
+def test_pool_saturated(get_mock):
+    client = InternetArchiveClient("http://archive.org", max_workers=2, pool_maxsize=1)
+    client.cache = {}
+    barrier = threading.Barrier(2, timeout=5)
+
+    def get(url, **kwargs):
+        barrier.wait()
+        return response(json=ITEM)
+
+    get_mock.side_effect = get
+    results = client.getitems(["album1", "album2"])
+    assert results == {"album1": ITEM, "album2": ITEM}
+    assert client.stats["active_max"] == 2
+    assert client.stats["pool_saturated"] == 1
+
+
+def test_resolve(client):
+    client.urls = {}
+    url = "http://archive.org/download/album/track01.mp3"
+    with mock.patch("requests.Session.head") as head_mock:
+        head_mock.return_value = mock.Mock(
+            is_redirect=True, headers={"Location": "//ia800.archive.org/track01.mp3"}
+        )
+        assert client.resolve(url) == "http://ia800.archive.org/track01.mp3"
+        assert client.resolve(url) == "http://ia800.archive.org/track01.mp3"
+        head_mock.assert_called_once()
+        # refreshing an item discards resolved URLs
+        client.evict("album")
+        head_mock.side_effect = Exception("timeout")
+        assert client.resolve(url) == url
+        assert head_mock.call_count == 2
+        # non-blocking calls resolve in the background
+        head_mock.side_effect = None
+        assert client.resolve(url, block=False) == url
+        client.submit(lambda: None).result()  # wait for background request
+        assert (
+            client.resolve(url, block=False) == "http://ia800.archive.org/track01.mp3"
+        )
+        assert head_mock.call_count == 3
+
+
+def test_peek(client, get_mock):
+    get_mock.return_value = response(json=ITEM)
+    assert client.peek("album") is None
+    client.getitem("album")
+    assert client.peek("album") == ITEM
+    assert get_mock.call_count == 1
+    assert client.getimageurl("album") == "http://archive.org/services/img/album"
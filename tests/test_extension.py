@@ -21,16 +21,35 @@ def test_get_config_schema():
     assert "base_url" in schema
     assert "browse_limit" in schema
     assert "browse_order" in schema
+    assert "browse_paginate" in schema
+    assert "browse_warmup" in schema
     assert "cache_size" in schema
     assert "cache_ttl" in schema
+    assert "cache_stale_ttl" in schema
+    assert "cache_max_bytes" in schema
+    assert "cache_snapshot" in schema
+    assert "resolve_ttl" in schema
+    assert "audio_cache_size" in schema
+    assert "playback_prefetch" in schema
     assert "collections" in schema
+    assert "concurrency" in schema
+    assert "disk_cache_size" in schema
     assert "exclude_collections" in schema
     assert "exclude_mediatypes" in schema
     assert "image_formats" in schema
+    assert "image_service" in schema
+    assert "keep_alive" in schema
+    assert "prefetch_count" in schema
+    assert "prefetch_delay" in schema
+    assert "pool_connections" in schema
+    assert "pool_maxsize" in schema
     assert "retries" in schema
+    assert "retry_backoff" in schema
+    assert "retry_jitter" in schema
     assert "search_limit" in schema
     assert "search_order" in schema
     assert "timeout" in schema
+    assert "track_cache_size" in schema
 
 
 def test_setup():
@@ -1,5 +1,7 @@
 from mopidy import models
 
+import pytest
+
 URL = "http://archive.org/download/album/cover.jpg"
 
 ITEM = {
@@ -52,3 +54,30 @@ def test_track_images(library, client_mock):
         "internetarchive:album#track01.jpg": IMAGES,
         "internetarchive:album#track02.jpg": IMAGES,
     }
+
+
+def test_unknown_images(library, client_mock):
+    client_mock.getitem.side_effect = LookupError("null")
+    results = library.get_images(["internetarchive:null"])
+    client_mock.getitem.assert_called_once_with("null")
+    assert results == {}
+
+
+@pytest.mark.internetarchive(image_service=True)
+def test_service_images(library, client_mock):
+    client_mock.peek.return_value = None
+    client_mock.getimageurl.return_value = "http://archive.org/services/img/album"
+    results = library.get_images(["internetarchive:album"])
+    client_mock.getitem.assert_not_called()
+    client_mock.getimageurl.assert_called_once_with("album")
+    assert results == {
+        "internetarchive:album": [
+            models.Image(uri="http://archive.org/services/img/album")
+        ]
+    }
+    # cached items provide images from files
+    client_mock.peek.return_value = ITEM
+    client_mock.geturl.return_value = URL
+    results = library.get_images(["internetarchive:album"])
+    client_mock.getitem.assert_not_called()
+    assert results == {"internetarchive:album": IMAGES}
@@ -1,5 +1,9 @@
+from unittest import mock
+
 from mopidy import models
 
+from mopidy_internetarchive.cache import Snapshot
+
 import pytest
 
 ITEM = {
@@ -68,6 +72,7 @@ def test_lookup_refresh(library, client_mock):
     # clear lookup cache
     library.refresh()
     assert client_mock.cache.clear.called
+    assert client_mock.store.clear.called
     # assert lookup cache is cleared
     client_mock.reset_mock()
     results = library.lookup("internetarchive:album#track02.mp3")
@@ -80,3 +85,91 @@ def test_lookup_unknown(library, client_mock):
     with pytest.raises(LookupError):
         library.lookup("internetarchive:null")
     client_mock.getitem.assert_called_once_with("null")
+
+
+def test_lookup_many(library, client_mock):
+    client_mock.getitem.return_value = ITEM
+    results = library.lookup_many(
+        ["internetarchive:album#track02.mp3", "internetarchive:album"]
+    )
+    client_mock.getitems.assert_called_once()
+    assert results == {
+        "internetarchive:album#track02.mp3": [TRACK2],
+        "internetarchive:album": [TRACK1, TRACK2],
+    }
+
+
+def test_lookup_many_items(library, client_mock):
+    def getitem(identifier):
+        if identifier == "album":
+            return ITEM
+        else:
+            raise LookupError(identifier)
+
+    client_mock.getitem.side_effect = getitem
+    results = library.lookup_many(
+        [
+            "internetarchive:album#track01.mp3",
+            "internetarchive:null#track01.mp3",
+            "internetarchive:album#track02.mp3",
+            "internetarchive:album#track03.mp3",
+            "internetarchive:",
+        ]
+    )
+    client_mock.getitems.assert_called_once()
+    assert sorted(client_mock.getitems.call_args[0][0]) == ["album", "null"]
+    assert results == {
+        "internetarchive:album#track01.mp3": [TRACK1],
+        "internetarchive:null#track01.mp3": [],
+        "internetarchive:album#track02.mp3": [TRACK2],
+        "internetarchive:album#track03.mp3": [],
+        "internetarchive:": [],
+    }
+    # assert lookup cache is used
+    client_mock.reset_mock()
+    assert library.lookup("internetarchive:album#track02.mp3") == [TRACK2]
+    client_mock.getitem.assert_not_called()
+
+
+def test_lookup_cache(library, client_mock):
+    def getitem(identifier):
+        return dict(ITEM, metadata=dict(ITEM["metadata"], identifier=identifier))
+
+    client_mock.getitem.side_effect = getitem
+    for identifier in ("album1", "album2", "album1", "album2"):
+        library.lookup("internetarchive:%s#track01.mp3" % identifier)
+    assert client_mock.getitem.call_count == 2
+    # track_cache_size is 10, so tracks of five items fit into cache
+    for n in range(3, 8):
+        library.lookup("internetarchive:album%d" % n)
+    assert client_mock.getitem.call_count == 7
+    client_mock.reset_mock()
+    library.lookup("internetarchive:album1")
+    library.lookup("internetarchive:album7")
+    client_mock.getitem.assert_called_once_with("album1")
+
+
+def test_lookup_expired(library, client_mock):
+    client_mock.getitem.return_value = ITEM
+    client_mock.ttl = 10
+    client_mock.timer = mock.Mock(return_value=0)
+    client_mock.timestamp.side_effect = lambda identifier: client_mock.timer()
+    library.lookup("internetarchive:album")
+    library.browse("internetarchive:album")
+    client_mock.getitem.assert_called_once_with("album")
+    # tracks expire together with their item
+    client_mock.timer.return_value = 11
+    library.lookup("internetarchive:album")
+    library.browse("internetarchive:album")
+    assert client_mock.getitem.call_count == 2
+
+
+def test_lookup_snapshot(library, client_mock, tmp_path):
+    client_mock.getitem.return_value = ITEM
+    library.lookup("internetarchive:album")
+    Snapshot(tmp_path / "snapshot.json.gz").save([], **library.snapshot())
+    library.refresh()
+    client_mock.reset_mock()
+    library.restore(Snapshot(tmp_path / "snapshot.json.gz"))
+    assert library.lookup("internetarchive:album") == [TRACK1, TRACK2]
+    client_mock.getitem.assert_not_called()
@@ -1,3 +1,10 @@
+from unittest import mock
+
+from mopidy import models
+
+import pytest
+
+
 def test_translate_url(playback, client_mock):
     url = "http://archive.org/download/item/file.mp3"
     client_mock.geturl.return_value = url
@@ -5,3 +12,86 @@ def test_translate_url(playback, client_mock):
     client_mock.geturl.assert_called_once()
     assert client_mock.geturl.call_args == (("item", "file.mp3"),)
     assert result == url
+
+
+def test_translate_resolve(playback, client_mock):
+    url = "http://archive.org/download/item/file.mp3"
+    client_mock.geturl.return_value = url
+    client_mock.resolve.side_effect = None
+    client_mock.resolve.return_value = "http://ia800.archive.org/file.mp3"
+    result = playback.translate_uri("internetarchive:item#file.mp3")
+    client_mock.resolve.assert_called_once_with(url, block=False)
+    assert result == "http://ia800.archive.org/file.mp3"
+
+
+def test_translate_cached(playback, client_mock, tmp_path):
+    url = "http://archive.org/download/item/file.mp3"
+    client_mock.geturl.return_value = url
+    client_mock.getitem.return_value = {
+        "files": [{"name": "file.mp3", "size": "42", "md5": "0" * 32}],
+        "metadata": {"identifier": "item"},
+    }
+    client_mock.files = mock.Mock()
+    client_mock.files.get.return_value = None
+    assert playback.translate_uri("internetarchive:item#file.mp3") == url
+    client_mock.files.fetch.assert_called_once_with(
+        "item/file.mp3", url, "42", "0" * 32
+    )
+    client_mock.files.get.return_value = tmp_path / "file.mp3"
+    result = playback.translate_uri("internetarchive:item#file.mp3")
+    assert result == (tmp_path / "file.mp3").as_uri()
+    client_mock.files.fetch.assert_called_once()
+
+
+@pytest.mark.internetarchive(playback_prefetch=True, resolve_ttl=60)
+def test_translate_prefetch(playback, backend_mock, client_mock):
+    backend_mock.library.lookup.return_value = [
+        models.Track(uri="internetarchive:item#track01.mp3"),
+        models.Track(uri="internetarchive:item#track02.mp3"),
+    ]
+    client_mock.geturl.side_effect = lambda identifier, filename: filename
+    client_mock.urls = {}
+    playback.translate_uri("internetarchive:item#track01.mp3")
+    backend_mock.library.lookup.assert_called_once_with("internetarchive:item")
+    client_mock.submit.assert_called_once_with(client_mock.resolve, "track02.mp3")
+    # last track has no successor
+    client_mock.submit.reset_mock()
+    playback.translate_uri("internetarchive:item#track02.mp3")
+    client_mock.submit.assert_not_called()
+    # next track is not looked up unless item is cached
+    client_mock.peek.return_value = None
+    backend_mock.library.lookup.reset_mock()
+    playback.translate_uri("internetarchive:item#track01.mp3")
+    backend_mock.library.lookup.assert_not_called()
+
+
+@pytest.mark.internetarchive(playback_prefetch=True, audio_cache_size=1)
+def test_translate_prefetch_cached(playback, backend_mock, client_mock, tmp_path):
+    backend_mock.library.lookup.return_value = [
+        models.Track(uri="internetarchive:item#track01.mp3"),
+        models.Track(uri="internetarchive:item#track02.mp3"),
+    ]
+    client_mock.getitem.return_value = {
+        "files": [{"name": "track02.mp3"}],
+        "metadata": {"identifier": "item"},
+    }
+    client_mock.geturl.side_effect = lambda identifier, filename: filename
+    client_mock.files = mock.Mock()
+    client_mock.urls = None
+    client_mock.files.get.side_effect = lambda key: (
+        tmp_path / "track01.mp3" if key == "item/track01.mp3" else None
+    )
+    # next track is prepared when playing from the audio cache
+    result = playback.translate_uri("internetarchive:item#track01.mp3")
+    assert result == (tmp_path / "track01.mp3").as_uri()
+    client_mock.files.fetch.assert_called_once_with(
+        "item/track02.mp3", "track02.mp3", None, None
+    )
+
+
+@pytest.mark.internetarchive(playback_prefetch=True)
+def test_translate_prefetch_disabled(playback, backend_mock, client_mock, caplog):
+    (record,) = caplog.get_records("setup")
+    assert "playback_prefetch has no effect" in record.getMessage()
+    playback.translate_uri("internetarchive:item#track01.mp3")
+    backend_mock.library.lookup.assert_not_called()
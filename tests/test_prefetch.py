@@ -0,0 +1,58 @@
+import threading
+
+from mopidy_internetarchive.prefetch import Prefetcher
+
+
+def test_prefetch():
+    done = threading.Event()
+    keys = []
+
+    def func(key):
+        keys.append(key)
+        if key == "c":
+            done.set()
+
+    prefetcher = Prefetcher(func, 3)
+    prefetcher.prefetch(["a", "b", "c", "d"])
+    assert done.wait(5)
+    prefetcher.stop()
+    assert keys == ["a", "b", "c"]
+
+
+def test_prefetch_cancel():
+    started = threading.Event()
+    resume = threading.Event()
+    done = threading.Event()
+    keys = []
+
+    def func(key):
+        keys.append(key)
+        if key == "a":
+            started.set()
+            resume.wait(5)
+        elif key == "y":
+            done.set()
+
+    prefetcher = Prefetcher(func, 3)
+    prefetcher.prefetch(["a", "b", "c"])
+    assert started.wait(5)
+    prefetcher.prefetch(["x", "y"])
+    resume.set()
+    assert done.wait(5)
+    prefetcher.stop()
+    assert keys == ["a", "x", "y"]
+
+
+def test_prefetch_error():
+    done = threading.Event()
+
+    def func(key):
+        if key == "b":
+            done.set()
+        else:
+            raise LookupError(key)
+
+    prefetcher = Prefetcher(func, 2)
+    prefetcher.prefetch(["a", "b"])
+    assert done.wait(5)
+    prefetcher.stop()
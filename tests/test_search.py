@@ -1,5 +1,7 @@
 from mopidy import models
 
+import pytest
+
 
 def test_search_any(library, client_mock):
     client_mock.search.return_value = client_mock.SearchResult(
@@ -37,3 +39,41 @@ def test_search_unknown(library, client_mock):
     result = library.search(dict(foo=["bar"]))
     client_mock.search.assert_not_called()
     assert result is None
+
+
+@pytest.mark.internetarchive(cache_size=128)
+def test_search_cache(library, client_mock):
+    library.search(dict(any=["foo", "bar"], album=["baz"]))
+    library.search(dict(album=["baz"], any=["bar", "foo"]))
+    client_mock.search.assert_called_once()
+    library.search(dict(any=["foo"]))
+    assert client_mock.search.call_count == 2
+    library.refresh()
+    library.search(dict(any=["foo"]))
+    assert client_mock.search.call_count == 3
+    # refreshing a collection only clears searches scoped to it
+    library.search(dict(any=["foo"]), uris=["internetarchive:etree"])
+    library.search(dict(any=["foo"]), uris=["internetarchive:audio"])
+    assert client_mock.search.call_count == 5
+    library.refresh("internetarchive:etree")
+    library.search(dict(any=["foo"]), uris=["internetarchive:audio"])
+    assert client_mock.search.call_count == 5
+    library.search(dict(any=["foo"]), uris=["internetarchive:etree"])
+    library.search(dict(any=["foo"]))
+    assert client_mock.search.call_count == 7
+
+
+def test_search_prefetch(library, client_mock):
+    client_mock.search.return_value = client_mock.SearchResult(
+        {
+            "response": {
+                "docs": [
+                    {"identifier": "album1", "title": "Album #1"},
+                    {"identifier": "album2", "title": "Album #2"},
+                ],
+                "numFound": 2,
+            },
+        }
+    )
+    library.search(dict(any=["album"]))
+    client_mock.prefetch.assert_called_once_with(["album1", "album2"])
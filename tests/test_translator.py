@@ -158,6 +158,22 @@ def test_album(album=translator.album):
     )
 
 
+def test_tracks(tracks=translator.tracks):
+    item = {
+        "files": [
+            {"name": "track%02d.mp3" % n, "format": "VBR MP3", "creator": "bar"}
+            for n in range(3)
+        ],
+        "metadata": {"identifier": "foo", "creator": "bar"},
+    }
+    result = tracks(item, ["VBR MP3"])
+    assert len(result) == 3
+    # artist and album models are shared between tracks
+    assert len({id(artist) for t in result for artist in t.artists}) == 1
+    assert len({id(t.album) for t in result}) == 1
+    assert tracks(item, ["VBR MP3"])[0].album is result[0].album
+
+
 def test_query(query=translator.query):
     assert r'"foo"' == query({"any": ["foo"]})
     assert r'"foo \"bar\""' == query({"any": ['foo "bar"']})